@@ -1,4 +1,4 @@
-import { Command, Response, isCommandSystem, isCommandSystemExit, isCommandUI, CommandUI, CommandSystem } from './types/commands'
+import { Command, Response, isCommandBatch, isCommandSystem, isCommandSystemExit, isCommandUI, CommandBatch, CommandUI, CommandSystem } from './types/commands'
 import { CommandHandler, Bridge, VisualisationEngine } from './types/modules'
 
 export default class CommandRouter implements CommandHandler {
@@ -11,6 +11,10 @@ export default class CommandRouter implements CommandHandler {
   }
 
   async onCommand (command: Command): Promise<Response> {
+    if (isCommandBatch(command)) {
+      return await this.onCommandBatch(command)
+    }
+
     return await new Promise<Response>((resolve, reject) => {
       if (isCommandSystem(command)) {
         this.onCommandSystem(command, resolve)
@@ -22,6 +26,15 @@ export default class CommandRouter implements CommandHandler {
     })
   }
 
+  async onCommandBatch (batch: CommandBatch): Promise<Response> {
+    // The commands are handled in order, the response to the last command (a render) is the response to the batch
+    let response: Response = { __type__: 'Response', command: batch, payload: { __type__: 'PayloadVoid', value: undefined } }
+    for (const command of batch.commands) {
+      response = await this.onCommand(command)
+    }
+    return response
+  }
+
   onCommandSystem (command: CommandSystem, resolve: (response: Response) => void): void {
     this.bridge.send(command)
 
@@ -1,3 +1,41 @@
+import json
+
+from port.api.props import RawJSON
+
+
+def _write_json(value, parts):
+    if isinstance(value, RawJSON):
+        parts.append(value)
+    elif isinstance(value, dict):
+        parts.append("{")
+        for i, (key, item) in enumerate(value.items()):
+            if i:
+                parts.append(",")
+            parts.append(json.dumps(str(key), ensure_ascii=False))
+            parts.append(":")
+            _write_json(item, parts)
+        parts.append("}")
+    elif isinstance(value, (list, tuple)):
+        parts.append("[")
+        for i, item in enumerate(value):
+            if i:
+                parts.append(",")
+            _write_json(item, parts)
+        parts.append("]")
+    else:
+        parts.append(json.dumps(value, ensure_ascii=False))
+
+
+def to_json_bytes(command):
+    """
+    Serializes a command to a single UTF-8 JSON buffer
+    Tables (RawJSON) are embedded as they are, they are not encoded a second time as a string
+    """
+    parts = []
+    _write_json(command.toDict(), parts)
+    return "".join(parts).encode("utf8")
+
+
 class CommandUIRender:
     __slots__ = "page"
 
@@ -39,3 +77,23 @@ class CommandSystemExit:
         dict["code"] = self.code
         dict["info"] = self.info
         return dict
+
+
+class CommandBatch:
+    __slots__ = "commands"
+
+    def __init__(self, commands):
+        self.commands = commands
+
+    def toDict(self):
+        dict = {}
+        dict["__type__"] = "CommandBatch"
+        dict["commands"] = [command.toDict() for command in self.commands]
+        return dict
+
+
+class CommandSystemFlush:
+    """
+    Is not sent to the host, asks ScriptWrapper to send the batched commands before the script continues
+    """
+    __slots__ = ()
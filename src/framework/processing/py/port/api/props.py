@@ -1,5 +1,7 @@
 from dataclasses import dataclass
 from typing import Optional, TypedDict
+import functools
+import json
 
 import pandas as pd
 
@@ -16,17 +18,80 @@ class Translations(TypedDict):
     nl: str
 
 
-@dataclass
+def _with_positional_index(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The UI reads rows by position (0, 1, 2, ...)
+    Chunks of a larger table keep their original index, relabel it without copying the data
+    """
+    index = df.index
+    if isinstance(index, pd.RangeIndex) and index.start == 0 and index.step == 1:
+        return df
+    return df.set_axis(pd.RangeIndex(len(df)), axis=0, copy=False)
+
+
+def _cached(to_dict):
+    """
+    Caches toDict of immutable (frozen) props, the dict is computed once and shared by every call
+    The shared dict must not be modified
+    """
+
+    @functools.wraps(to_dict)
+    def wrapper(self):
+        cached = self.__dict__.get("_dict")
+        if cached is None:
+            # frozen dataclasses block setattr, the cache is not a field
+            cached = self.__dict__["_dict"] = to_dict(self)
+        return cached
+
+    return wrapper
+
+
+class RawJSON(str):
+    """
+    Text that is already serialized JSON
+
+    commands.to_json_bytes embeds it as a JSON value instead of encoding it as a string,
+    toDict users (toJs) receive it as an ordinary string.
+    """
+
+
+def _data_frame_to_json(df: pd.DataFrame) -> RawJSON:
+    """
+    Serializes df like DataFrame.to_json(), column -> {row: value}
+    Categorical columns are sent dictionary encoded: column -> {"dictionary": [values], "codes": [codes]}
+    every unique value is sent once, a code of -1 is a missing value
+    """
+    df = _with_positional_index(df)
+    if not any(isinstance(dtype, pd.CategoricalDtype) for dtype in df.dtypes):
+        return RawJSON(df.to_json())
+
+    parts = []
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.cat.remove_unused_categories()
+            dictionary = pd.Series(series.cat.categories).to_json(orient="values")
+            codes = json.dumps(series.cat.codes.tolist())
+            value = f'{{"dictionary":{dictionary},"codes":{codes}}}'
+        else:
+            value = series.to_json()
+        parts.append(f"{json.dumps(str(column))}:{value}")
+
+    return RawJSON("{" + ",".join(parts) + "}")
+
+
+@dataclass(frozen=True)
 class Translatable:
     """Wrapper class for Translations"""
 
     translations: Translations
 
+    @_cached
     def toDict(self):
-        return self.__dict__.copy()
+        return {"translations": self.translations}
 
 
-@dataclass
+@dataclass(frozen=True)
 class PropsUIHeader:
     """Page header
 
@@ -36,6 +101,7 @@ class PropsUIHeader:
 
     title: Translatable
 
+    @_cached
     def toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIHeader"
@@ -43,7 +109,7 @@ class PropsUIHeader:
         return dict
 
 
-@dataclass
+@dataclass(frozen=True)
 class PropsUIFooter:
     """Page footer
 
@@ -51,13 +117,14 @@ class PropsUIFooter:
         progressPercentage: float indicating the progress in the flow
     """
 
+    @_cached
     def toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIFooter"
         return dict
 
 
-@dataclass
+@dataclass(frozen=True)
 class PropsUIPromptConfirm:
     """Retry submitting a file page
 
@@ -74,6 +141,7 @@ class PropsUIPromptConfirm:
     ok: Translatable
     cancel: Translatable
 
+    @_cached
     def toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIPromptConfirm"
@@ -106,7 +174,7 @@ class PropsUIPromptConsentFormTable:
         dict["__type__"] = "PropsUIPromptConsentFormTable"
         dict["id"] = self.id
         dict["title"] = self.title.toDict()
-        dict["data_frame"] = self.data_frame.to_json()
+        dict["data_frame"] = _data_frame_to_json(self.data_frame)
         dict["description"] = self.description.toDict() if self.description else None
         dict["visualizations"] = self.visualizations if self.visualizations else None
         dict["folded"] = self.folded
@@ -151,7 +219,7 @@ class PropsUIPromptConsentForm:
         return dict
 
 
-@dataclass
+@dataclass(frozen=True)
 class PropsUIPromptFileInput:
     """Prompt the user to submit a file
 
@@ -163,6 +231,7 @@ class PropsUIPromptFileInput:
     description: Translatable
     extensions: str
 
+    @_cached
     def toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIPromptFileInput"
@@ -183,7 +252,7 @@ class RadioItem(TypedDict):
     value: str
 
 
-@dataclass
+@dataclass(frozen=True)
 class PropsUIPromptRadioInput:
     """Radio group
 
@@ -199,6 +268,7 @@ class PropsUIPromptRadioInput:
     description: Translatable
     items: list[RadioItem]
 
+    @_cached
     def toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIPromptRadioInput"
@@ -208,7 +278,7 @@ class PropsUIPromptRadioInput:
         return dict
 
 
-@dataclass
+@dataclass(frozen=True)
 class PropsUIQuestionOpen:
     """
     NO DOCS YET
@@ -216,6 +286,7 @@ class PropsUIQuestionOpen:
     id: int
     question: Translatable
 
+    @_cached
     def toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIQuestionOpen"
@@ -224,7 +295,7 @@ class PropsUIQuestionOpen:
         return dict
 
 
-@dataclass
+@dataclass(frozen=True)
 class PropsUIQuestionMultipleChoiceCheckbox:
     """
     NO DOCS YET
@@ -233,6 +304,7 @@ class PropsUIQuestionMultipleChoiceCheckbox:
     question: Translatable
     choices: list[Translatable]
 
+    @_cached
     def toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIQuestionMultipleChoiceCheckbox"
@@ -242,7 +314,7 @@ class PropsUIQuestionMultipleChoiceCheckbox:
         return dict
 
 
-@dataclass
+@dataclass(frozen=True)
 class PropsUIQuestionMultipleChoice:
     """
     NO DOCS YET
@@ -251,6 +323,7 @@ class PropsUIQuestionMultipleChoice:
     question: Translatable
     choices: list[Translatable]
 
+    @_cached
     def toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIQuestionMultipleChoice"
@@ -260,7 +333,7 @@ class PropsUIQuestionMultipleChoice:
         return dict
 
 
-@dataclass
+@dataclass(frozen=True)
 class PropsUIPromptQuestionnaire:
     """
     NO DOCS YET
@@ -268,6 +341,7 @@ class PropsUIPromptQuestionnaire:
     description: Translatable
     questions: list[PropsUIQuestionMultipleChoice | PropsUIQuestionMultipleChoiceCheckbox | PropsUIQuestionOpen]
 
+    @_cached
     def toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIPromptQuestionnaire"
@@ -276,7 +350,7 @@ class PropsUIPromptQuestionnaire:
         return dict
 
 
-@dataclass
+@dataclass(frozen=True)
 class PropsUIPageDonation:
     """A multi-purpose page that gets shown to the user
 
@@ -307,9 +381,11 @@ class PropsUIPageDonation:
         return dict
 
 
+@dataclass(frozen=True)
 class PropsUIPageEnd:
     """An ending page to show the user they are done"""
 
+    @_cached
     def toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIPageEnd"
@@ -0,0 +1,172 @@
+"""
+Batch processing of donated DDPs outside the browser
+
+Re-processes a directory of Google Takeout zips in parallel and writes the tables
+the participant would have seen on the consent page. Every zip goes through
+google_home.validate and script.extract_google_home, the same code path as the in-browser flow.
+
+Example:
+
+    python -m port.batch ./zips ./output --format parquet --workers 4
+"""
+from dataclasses import dataclass, asdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import logging
+import sys
+import time
+
+import pandas as pd
+
+import port.google_home as google_home
+import port.memory as memory
+import port.parse_report as parse_report
+import port.script as script
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "parquet")
+LOG_FORMAT = "%(asctime)s --- %(processName)s --- %(name)s --- %(levelname)s --- %(message)s"
+
+
+@dataclass
+class BatchResult:
+    """
+    Status of a single processed zip
+
+    Attributes:
+        file: the zip that was processed
+        status_code: status code of the validation, see google_home.STATUS_CODES
+        category: the detected DDP category
+        tables: number of tables written
+        rows: total number of rows written
+        degraded: True if the extraction was truncated or sampled
+        failed_items: number of items that could not be parsed and were quarantined
+        seconds: processing time
+        outputs: files that were written, separated by ";"
+        error: error message in case processing failed
+    """
+
+    file: str
+    status_code: int | None = None
+    category: str | None = None
+    tables: int = 0
+    rows: int = 0
+    degraded: bool = False
+    failed_items: int = 0
+    seconds: float = 0.0
+    outputs: str = ""
+    error: str = ""
+
+
+def configure_logging(level: int = logging.WARNING) -> None:
+    """
+    Sends log records to stderr, used as the initializer of the worker processes
+
+    Importing port.script logs to script.LOG_STREAM, the buffer that is donated in the browser.
+    In a batch that buffer would grow with every zip and errors would never be shown.
+    """
+    logging.basicConfig(stream=sys.stderr, level=level, format=LOG_FORMAT, force=True)
+    script.LOG_STREAM.seek(0)
+    script.LOG_STREAM.truncate()
+
+
+def write_table(df: pd.DataFrame, path: Path, output_format: str) -> Path:
+    """
+    Writes a table as csv or parquet, returns the path written to
+    """
+    path = path.with_suffix(f".{output_format}")
+    if output_format == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+def process_zip(zfile: str, output_dir: str, output_format: str) -> BatchResult:
+    """
+    Validates and extracts a single zip, writes every table to output_dir
+    """
+    result = BatchResult(file=zfile)
+    t0 = time.perf_counter()
+
+    try:
+        validation = google_home.validate(Path(zfile))
+        result.status_code = validation.status_code.id if validation.status_code else None
+        result.category = validation.ddp_category.id if validation.ddp_category else None
+
+        if result.status_code in google_home.VALID_STATUS_CODES:
+            budget = memory.MemoryBudget(limit=script.MEMORY_BUDGET, max_rows=script.MEMORY_BUDGET_MAX_ROWS)
+            report = parse_report.ParseReport(error_budget=script.PARSE_ERROR_BUDGET)
+            tables = script.extract_google_home(zfile, validation, budget, report)
+            result.degraded = budget.degraded
+            result.failed_items = report.n_failed
+
+            outputs = []
+            for table in tables:
+                path = Path(output_dir) / f"{Path(zfile).stem}_{table.id}"
+                outputs.append(str(write_table(table.data_frame, path, output_format)))
+                result.rows += len(table.data_frame)
+
+            result.tables = len(tables)
+            result.outputs = ";".join(outputs)
+
+    except Exception as e:
+        logger.error("Could not process %s: %s", zfile, e)
+        result.error = f"{type(e).__name__}: {e}"
+
+    result.seconds = time.perf_counter() - t0
+    return result
+
+
+def process_directory(
+    input_dir: str,
+    output_dir: str,
+    output_format: str = "csv",
+    workers: int | None = None,
+    log_level: int = logging.WARNING,
+) -> pd.DataFrame:
+    """
+    Processes all zips in input_dir in a process pool, the workers log to stderr at log_level
+    Returns the status report, the report is also written to output_dir
+    """
+    zfiles = sorted(str(p) for p in Path(input_dir).glob("*.zip"))
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=configure_logging, initargs=(log_level,)) as executor:
+        futures = [executor.submit(process_zip, zfile, output_dir, output_format) for zfile in zfiles]
+        results = [future.result() for future in futures]
+
+    report = pd.DataFrame([asdict(result) for result in results], columns=list(BatchResult.__dataclass_fields__))
+    report.to_csv(Path(output_dir) / "report.csv", index=False)
+    return report
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Extract the Google Home tables from a directory of Takeout zips")
+    parser.add_argument("input_dir", help="directory containing the zips")
+    parser.add_argument("output_dir", help="directory to write the tables and report.csv to")
+    parser.add_argument("--format", choices=FORMATS, default="csv", dest="output_format")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, defaults to the number of CPUs")
+    parser.add_argument("--log-level", choices=("DEBUG", "INFO", "WARNING", "ERROR"), default="WARNING")
+    args = parser.parse_args(argv)
+    log_level = getattr(logging, args.log_level)
+    configure_logging(log_level)
+
+    if args.output_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error("--format parquet requires pyarrow to be installed")
+
+    report = process_directory(args.input_dir, args.output_dir, args.output_format, args.workers, log_level)
+    columns = ["file", "status_code", "tables", "rows", "degraded", "failed_items", "seconds", "error"]
+    print(report[columns].to_string(index=False))
+
+    failed = report["error"].ne("") | ~report["status_code"].isin(google_home.VALID_STATUS_CODES)
+    return 1 if failed.any() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Micro benchmarks for the extraction steps
+
+Example:
+
+    python -m port.bench normalize_commands --rows 1000000
+"""
+from typing import Callable
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+import zlib
+
+import pandas as pd
+
+import port.api.commands as commands
+import port.api.props as props
+import port.google_home as google_home
+import port.helpers as helpers
+import port.scrub as scrub
+import port.unzipddp as unzipddp
+from port.validate import Language
+
+BENCHMARKS: dict[str, Callable[[int], dict[str, float]]] = {}
+
+
+def benchmark(fun: Callable[[int], dict[str, float]]) -> Callable[[int], dict[str, float]]:
+    BENCHMARKS[fun.__name__] = fun
+    return fun
+
+
+def timed(fun: Callable[[], object], repeat: int = 3) -> float:
+    """
+    Returns the best wall clock time of repeat runs of fun
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fun()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+@benchmark
+def normalize_commands(rows: int) -> dict[str, float]:
+    """
+    Cost per row of normalize_commands compared to a plain string copy of the column
+    """
+    commands = ["zet de lichten aan", "dim de lichten naar 50%", "wat is het weer morgen", "speel muziek"]
+    rng = random.Random(0)
+    series = pd.Series([f"Je hebt {rng.choice(commands)} gezegd" for _ in range(rows)])
+
+    baseline = timed(lambda: series.astype(str).copy())
+    normalize = timed(lambda: google_home.normalize_commands(series, Language.NL))
+    return {
+        "baseline_us_per_row": baseline / rows * 1e6,
+        "normalize_us_per_row": normalize / rows * 1e6,
+    }
+
+
+@benchmark
+def scrub_commands(rows: int) -> dict[str, float]:
+    """
+    Cost per row of scrubbing a command column with all PII patterns and 1000 terms
+    """
+    rng = random.Random(0)
+    names = [f"naam{i}" for i in range(1000)]
+    commands = [
+        "zet de lichten aan", "bel {} op 06-12345678", "stuur een mail naar {}@example.com", "speel muziek van {}",
+    ]
+    series = pd.Series([rng.choice(commands).format(rng.choice(names)) for _ in range(rows)])
+    scrubber = scrub.Scrubber(scrub.ScrubConfig(terms=tuple(names)))
+
+    baseline = timed(lambda: series.astype(str).copy())
+    scrubbed = timed(lambda: scrubber.scrub_series(series))
+    return {
+        "baseline_us_per_row": baseline / rows * 1e6,
+        "scrub_us_per_row": scrubbed / rows * 1e6,
+    }
+
+
+@benchmark
+def html_cards(rows: int) -> dict[str, float]:
+    """
+    Cost per card of the card scanner compared to the lxml DOM and the lxml streaming parser
+    """
+    rng = random.Random(0)
+    commands = ["zet de lichten aan", "dim de lichten naar 50%", "wat is het weer morgen", "speel muziek"]
+    responses = ["<br>Oké", "<br>Het is 12 graden", ""]
+    card = (
+        '<div class="outer-cell mdl-cell mdl-cell--12-col mdl-shadow--2dp"><div class="mdl-grid">'
+        '<div class="{card}">Gezegd&nbsp;<a href="https://www.google.com">{command}</a>{response}<br>'
+        '12 mrt 2024, 10:15:02 CET</div>'
+        '<div class="{card} mdl-typography--text-right"></div></div></div>'
+    )
+    html = (
+        '<html><head><meta charset="utf-8"></head><body>'
+        + "".join(
+            card.format(card=google_home.CARD_CLASS, command=rng.choice(commands), response=rng.choice(responses))
+            for _ in range(rows)
+        )
+        + "</body></html>"
+    ).encode()
+
+    dom = timed(lambda: list(google_home.iter_cards(io.BytesIO(html))))
+    streaming = timed(lambda: list(google_home.iter_cards_streaming(io.BytesIO(html))))
+    scanning = timed(lambda: list(google_home.iter_cards_scanning(io.BytesIO(html))))
+    return {
+        "lxml_dom_us_per_card": dom / rows * 1e6,
+        "lxml_streaming_us_per_card": streaming / rows * 1e6,
+        "scanner_us_per_card": scanning / rows * 1e6,
+    }
+
+
+@benchmark
+def zip_members(rows: int) -> dict[str, float]:
+    """
+    Throughput of zipfile compared to the memory mapped archive, rows is the size of the members in MiB
+    The zip contains a stored member (like photos and videos in a DDP) and a deflated member (like the activity files)
+    """
+    mib = 1024 * 1024
+    rng = random.Random(0)
+    binary = rng.randbytes(mib)
+    text = "".join(f"Je hebt zet de lichten aan gezegd {rng.random()}\n" for _ in range(mib // 40)).encode()[:mib]
+
+    def stream(archive: type, name: str) -> None:
+        with archive(path) as zf, zf.open(name) as f:
+            while f.read(mib):
+                pass
+
+    def read(archive: type, name: str) -> None:
+        with archive(path) as zf:
+            zf.read(name)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ddp.zip")
+        with zipfile.ZipFile(path, "w") as zf:
+            with zf.open(zipfile.ZipInfo("media.bin"), "w", force_zip64=True) as f:
+                for _ in range(rows):
+                    f.write(binary)
+            info = zipfile.ZipInfo("activity.txt")
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with zf.open(info, "w", force_zip64=True) as f:
+                for _ in range(rows):
+                    f.write(text)
+
+        out = {}
+        for name in ["media.bin", "activity.txt"]:
+            for method, fun in [("read", read), ("stream", stream)]:
+                for label, archive in [("zipfile", zipfile.ZipFile), ("mmap", unzipddp.MmapArchive)]:
+                    seconds = timed(lambda: fun(archive, name))
+                    out[f"{name}_{method}_{label}_mib_per_s"] = rows / seconds
+
+        def view() -> None:
+            with unzipddp.MmapArchive(path) as zf, zf.view("media.bin") as data:
+                zlib.crc32(data)
+
+        out["media.bin_view_mmap_mib_per_s"] = rows / timed(view)
+        return out
+
+
+@benchmark
+def serialize_commands(rows: int) -> dict[str, float]:
+    """
+    Cost and size of a consent form of rows interactions: toDict (converted with toJs in the browser)
+    compared to a single JSON buffer (parsed with JSON.parse in the browser)
+    The toJs conversion itself only runs in Pyodide, the dict path is measured up to the handover
+    """
+    rng = random.Random(0)
+    commands_ = ["zet de lichten aan", "dim de lichten naar 50%", "wat is het weer morgen", "speel muziek"]
+    df = pd.DataFrame({
+        "Dag en tijd": pd.date_range("2024-01-01", periods=rows, freq="min").astype(str),
+        "Uw commando": pd.Categorical([rng.choice(commands_) for _ in range(rows)]),
+        "Reactie van de assistent": [f"Het is {rng.randrange(30)} graden" for _ in range(rows)],
+    })
+    title = props.Translatable({"en": "Data", "nl": "Gegevens"})
+    table = props.PropsUIPromptConsentFormTable("google_home_data", title, df)
+    command = commands.CommandUIRender(props.PropsUIPromptConsentForm([table], []))
+
+    to_dict = timed(command.toDict)
+    to_bytes = timed(lambda: commands.to_json_bytes(command))
+    return {
+        "to_dict_ms": to_dict * 1e3,
+        "to_json_bytes_ms": to_bytes * 1e3,
+        "dict_as_json_kib": len(json.dumps(command.toDict()).encode("utf8")) / 1024,
+        "json_bytes_kib": len(commands.to_json_bytes(command)) / 1024,
+    }
+
+
+@benchmark
+def find_items(rows: int) -> dict[str, float]:
+    """
+    Cost of a lookup in a denested dict of rows posts: find_items on the dict (a regex scan of every key)
+    compared to find_items on a DenestedIndex (without the memoization) and DenestedIndex.find_suffix
+    """
+    posts = [{"title": f"post {i}", "media": [{"uri": f"{i}.jpg", "creation_timestamp": i}]} for i in range(rows)]
+    denested = helpers.dict_denester({"posts": posts})
+    queries = ["title", "uri", "creation_timestamp", "missing"]
+
+    build = timed(lambda: helpers.DenestedIndex(denested), repeat=1)
+    index = helpers.DenestedIndex(denested)
+    scan = timed(lambda: [helpers.find_items(denested, q) for q in queries], repeat=1)
+
+    def indexed_lookups():
+        index.cache.clear()
+        return [helpers.find_items(index, q) for q in queries]
+
+    indexed = timed(indexed_lookups)
+    suffix = timed(lambda: [index.find_suffix(q) for q in queries])
+    return {
+        "index_build_ms": build * 1e3,
+        "scan_ms_per_lookup": scan / len(queries) * 1e3,
+        "index_ms_per_lookup": indexed / len(queries) * 1e3,
+        "suffix_us_per_lookup": suffix / len(queries) * 1e6,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run extraction micro benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    for name, value in BENCHMARKS[args.benchmark](args.rows).items():
+        print(f"{name}: {value:.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
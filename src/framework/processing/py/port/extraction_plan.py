@@ -0,0 +1,139 @@
+"""
+Contains the extraction planner that reads all files an extraction needs in a single pass over a zipfile
+
+Extractors declare which files they need (glob or file name) and a parser for them.
+The planner opens the zipfile once, matches the requests against the index of the zipfile
+and reads the matching files in the order they are stored, every file is streamed to its parser.
+Adding a table to an extraction adds a request, not another scan of the zipfile.
+"""
+from dataclasses import dataclass, field
+from pathlib import PurePosixPath
+from typing import Any, Callable, IO
+import fnmatch
+import logging
+import zipfile
+
+import port.memory as memory
+import port.unzipddp as unzipddp
+import port.ziprecover as ziprecover
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PlannedMember:
+    """
+    File in the zipfile that is read by the plan
+
+    Attributes:
+        path: path of the file in the zip
+        file_size: uncompressed size in bytes, 0 if unknown (truncated zipfile)
+        offset: offset of the file in the zip, files are read in this order
+    """
+    path: str
+    file_size: int
+    offset: int
+
+
+@dataclass
+class MemberRequest:
+    """
+    Files requested by an extractor
+
+    Attributes:
+        patterns: glob patterns matched on the full path or on the file name of every file in the zip
+        parser: called with the decompressed stream and the PlannedMember of every selected file
+        select: optional, called with the paths of the matching files, returns the paths to read in order of priority
+        selected: the paths that were selected, in order of priority
+        results: the return value of the parser per path, files that could not be parsed are missing
+    """
+    patterns: tuple[str, ...]
+    parser: Callable[[IO[bytes], PlannedMember], Any]
+    select: Callable[[list[str]], list[str]] | None = None
+    selected: list[str] = field(default_factory=list)
+    results: dict[str, Any] = field(default_factory=dict)
+
+    def matches(self, path: str) -> bool:
+        name = PurePosixPath(path).name
+        return any(
+            fnmatch.fnmatchcase(path, pattern) or fnmatch.fnmatchcase(name, pattern) for pattern in self.patterns
+        )
+
+
+class ExtractionPlan:
+    """
+    Collects the requests of the extractors and reads the requested files in a single pass
+    """
+
+    def __init__(self) -> None:
+        self.requests: list[MemberRequest] = []
+
+    def request(
+        self,
+        patterns: tuple[str, ...] | list[str],
+        parser: Callable[[IO[bytes], PlannedMember], Any],
+        select: Callable[[list[str]], list[str]] | None = None,
+    ) -> MemberRequest:
+        """
+        Adds a request, the results can be read from the returned request after run
+        """
+        request = MemberRequest(tuple(patterns), parser, select)
+        self.requests.append(request)
+        return request
+
+    def _schedule(self, members: list[PlannedMember]) -> list[tuple[PlannedMember, MemberRequest]]:
+        by_path = {member.path: member for member in members}
+        jobs = []
+        for request in self.requests:
+            paths = [member.path for member in members if request.matches(member.path)]
+            request.selected = request.select(paths) if request.select is not None else paths
+            jobs.extend((by_path[path], request) for path in request.selected)
+
+        return sorted(jobs, key=lambda job: job[0].offset)
+
+    def run(self, zfile: str, budget: memory.MemoryBudget | None = None) -> None:
+        """
+        Reads every requested file once, in the order the files are stored in the zipfile
+        If the zipfile is truncated, the files are found by their local file headers (see ziprecover)
+
+        Files that cannot be read or parsed are logged and skipped
+        """
+        if budget is not None:
+            budget.start()
+
+        try:
+            try:
+                zf = unzipddp.open_zipfile(zfile)
+            except zipfile.BadZipFile as e:
+                logger.warning("BadZipFile:  %s, reading the local file headers", e)
+                members = [
+                    PlannedMember(member.filename, member.file_size or 0, member.header_offset)
+                    for member in ziprecover.scan_local_headers(zfile)
+                ]
+                self._dispatch(members, lambda member: ziprecover.open_member(zfile, member.path))
+                return
+
+            with zf:
+                members = [
+                    PlannedMember(info.filename, info.file_size, info.header_offset)
+                    for info in zf.infolist() if not info.is_dir()
+                ]
+                self._dispatch(members, lambda member: zf.open(member.path, "r"))
+
+        except Exception as e:
+            logger.error("Could not read %s: %s", zfile, e)
+
+        finally:
+            if budget is not None:
+                budget.stop()
+
+    def _dispatch(self, members: list[PlannedMember], open_member: Callable) -> None:
+        jobs = self._schedule(members)
+        logger.debug("Reading %s out of %s files", len(jobs), len(members))
+
+        for member, request in jobs:
+            try:
+                with open_member(member) as stream:
+                    request.results[member.path] = request.parser(stream, member)
+            except Exception as e:
+                logger.error("Could not parse %s: %s", member.path, e)
@@ -1,8 +1,16 @@
 """
 DDP extract Google Home
 """
+from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
+from typing import IO, Iterator
+import functools
+import html
+import io
 import logging
+import re
+import sys
 import zipfile
 
 import zipfile
@@ -18,8 +26,13 @@ from port.validate import (
     ValidateInput,
     StatusCode,
 )
+import port.extraction_plan as extraction_plan
 import port.helpers as helpers
+import port.memory as memory
+import port.parse_report as parse_report
+import port.sampling as sampling
 import port.unzipddp as unzipddp
+import port.ziprecover as ziprecover
 
 logger = logging.getLogger(__name__)
 
@@ -77,8 +90,12 @@ STATUS_CODES = [
     StatusCode(id=0, description="Valid DDP", message=""),
     StatusCode(id=1, description="Valid DDP unhandled format", message=""),
     StatusCode(id=2, description="Bad zipfile", message=""),
+    StatusCode(id=3, description="Truncated zipfile, partially recovered", message=""),
 ]
 
+# Status codes of DDPs that can be extracted
+VALID_STATUS_CODES = (0, 3)
+
 
 def validate(zfile: Path) -> ValidateInput:
     """
@@ -88,7 +105,7 @@ def validate(zfile: Path) -> ValidateInput:
 
     try:
         paths = []
-        with zipfile.ZipFile(zfile, "r") as zf:
+        with unzipddp.open_zipfile(zfile) as zf:
             for f in zf.namelist():
                 p = Path(f)
                 if p.suffix in (".json", ".csv", ".html"):
@@ -103,9 +120,66 @@ def validate(zfile: Path) -> ValidateInput:
     except zipfile.BadZipFile:
         validation.set_status_code(2)
 
+        # Truncated uploads miss the central directory, the members before the cut-off can still be recovered
+        try:
+            paths = [Path(f).name for f in ziprecover.namelist(str(zfile))]
+            if validation.infer_ddp_category(paths) and find_activity_sources(str(zfile), validation):
+                logger.info("Recovered a truncated zipfile")
+                validation.set_status_code(3)
+        except Exception as e:
+            logger.error("Could not recover zipfile: %s", e)
+
     return validation
 
 
+@dataclass
+class CommandRule:
+    """
+    Words Google adds around a command, per language
+
+    Attributes:
+        prefixes: words in front of the command, example: "Je hebt"
+        suffixes: words after the command, example: "gezegd"
+    """
+    prefixes: list[str]
+    suffixes: list[str]
+
+
+COMMAND_RULES = {
+    Language.NL: CommandRule(prefixes=["Je hebt", "Gezegd:", "Gezegd"], suffixes=["gezegd"]),
+    Language.EN: CommandRule(prefixes=["You said", "Said:", "Said"], suffixes=["said"]),
+    Language.DE: CommandRule(prefixes=["Du hast", "Gesagt:", "Gesagt"], suffixes=["gesagt"]),
+}
+
+
+def _alternation(words: list[str]) -> str:
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+@functools.lru_cache(maxsize=None)
+def compile_command_rule(language: Language | None = None) -> re.Pattern:
+    """
+    Compiles the prefixes and suffixes of a language into a single regex
+    The command is captured in the first group. If language is None the rules of all languages are combined
+    """
+    rules = [COMMAND_RULES[language]] if language in COMMAND_RULES else list(COMMAND_RULES.values())
+    prefixes = _alternation([p for rule in rules for p in rule.prefixes])
+    suffixes = _alternation([s for rule in rules for s in rule.suffixes])
+    return re.compile(rf"^\s*(?:(?:{prefixes})\s+)?(.*?)(?:\s+(?:{suffixes}))?\s*$", flags=re.DOTALL)
+
+
+def normalize_commands(commands: pd.Series, language: Language | None = None) -> pd.Series:
+    """
+    Strips the words Google adds around a command (e.g. "Je hebt ... gezegd") from a column of commands
+    Only for the title field of the JSON activity, the HTML activity contains the command without these words
+    """
+    pattern = compile_command_rule(language)
+
+    # commands repeat a lot, only normalize the distinct commands
+    codes, uniques = pd.factorize(commands.astype(str))
+    normalized = pd.Series(uniques, dtype=object).str.extract(pattern, expand=False)
+    return pd.Series(normalized.to_numpy()[codes], index=commands.index, dtype=object)
+
 
 def json_data_to_dataframe(json_data) -> pd.DataFrame:
     out = pd.DataFrame()
@@ -149,13 +223,13 @@ def clean_response(response_list: list) -> str:
         if is_nan(response_list):
             out = "Geen reactie"
 
-        return out
+        return sys.intern(out)
 
     except Exception as e:
         return str(response_list)
         
         
-def clean_extracted_data(df: pd.DataFrame) -> pd.DataFrame:
+def clean_extracted_data(df: pd.DataFrame, language: Language | None = None) -> pd.DataFrame:
     out = df
 
     try:
@@ -171,16 +245,12 @@ def clean_extracted_data(df: pd.DataFrame) -> pd.DataFrame:
         columns_to_remove2 = ['title', 'subtitles']
         df_to_donate = df_cleaned.drop(columns=columns_to_remove2, axis=1)
 
-        # Remove last word in entries of the Commando column (ger: gesagt, en: said, nl: gezegd)
-        df_to_donate['Uw commando'] = df_to_donate['Uw commando'].str.rsplit(' ', 1).str[0]
-        # For NL this means also removing 'Je hebt' in combination with 'gezegd'
-        df_to_donate['Uw commando'] = df_to_donate['Uw commando'].str.replace('Je hebt', '')
-
+        # Remove the words around the command (nl: Je hebt ... gezegd, de: ... gesagt, en: said ...)
+        df_to_donate['Uw commando'] = normalize_commands(df_to_donate['Uw commando'], language)
 
-        # Dropping miliseconds and adjusting format of day and time
-        df_to_donate['Dag en tijd'] = df_to_donate['time'].str.replace(r"\.\d+", "")
-        # Replace 'T' with ',' and remove 'Z'
-        df_to_donate['Dag en tijd'] = df_to_donate['Dag en tijd'].str.replace('T', ', ').str.replace('Z', '')
+        # Convert the ISO 8601 timestamps to the datetime representation shared with the HTML path
+        timestamps = helpers.to_datetime_column(df_to_donate['time'], helpers.TimestampType.ISO8601)
+        df_to_donate['Dag en tijd'] = helpers.format_datetime_column(timestamps, fallback=df_to_donate['time'])
 
         # Select and reorder columns
         out = df_to_donate[['Dag en tijd', 'Uw commando', 'Reactie van de assistent']]
@@ -188,93 +258,930 @@ def clean_extracted_data(df: pd.DataFrame) -> pd.DataFrame:
         print(e)
     finally:
         return out
-    
 
 
-def google_home_html_to_df(html_buf):
+@dataclass
+class StudyWindow:
+    """
+    Time window (and row cap) of a study, applied while the DDP is parsed
+
+    Attributes:
+        start: only interactions at or after start are kept, example: "2024-01-01"
+        end: only interactions before end are kept
+        max_rows: parsing stops after max_rows interactions are kept
+        newest_first: the DDP lists interactions newest first, parsing stops at the first interaction before start
+
+    Naive datetimes are interpreted as UTC. Interactions without a valid date are kept.
+    """
+    start: pd.Timestamp | str | None = None
+    end: pd.Timestamp | str | None = None
+    max_rows: int | None = None
+    newest_first: bool = True
+
+    def __post_init__(self) -> None:
+        self.start = self._to_utc(self.start)
+        self.end = self._to_utc(self.end)
+
+    @staticmethod
+    def _to_utc(value) -> pd.Timestamp | None:
+        if value is None:
+            return None
+        value = pd.Timestamp(value)
+        return value.tz_localize("UTC") if value.tzinfo is None else value.tz_convert("UTC")
+
+    @property
+    def is_limited(self) -> bool:
+        return self.start is not None or self.end is not None or self.max_rows is not None
+
+    def is_before(self, timestamp) -> bool:
+        return self.start is not None and timestamp is not pd.NaT and timestamp < self.start
+
+    def is_after(self, timestamp) -> bool:
+        return self.end is not None and timestamp is not pd.NaT and timestamp >= self.end
+
+
+RE_YEAR_MONTH = re.compile(r"\d{4}-\d{2}")
+
+
+def month_of(timestamp) -> str:
+    """
+    Returns the month of a timestamp as YYYY-MM, empty string for NaT
+    """
+    if timestamp is pd.NaT:
+        return ""
+    return f"{timestamp.year:04d}-{timestamp.month:02d}"
+
+
+def json_item_timestamp(item) -> pd.Timestamp:
+    """
+    Returns the "time" of an item of MyActivity.json in UTC, NaT if it has no valid time
+    """
+    try:
+        return pd.Timestamp(datetime.fromisoformat(item["time"])).tz_convert("UTC")
+    except Exception:
+        return pd.NaT
+
+
+def json_item_month(item) -> str:
+    time = str(item.get("time", "")) if isinstance(item, dict) else ""
+    return time[:7] if RE_YEAR_MONTH.match(time) else ""
+
+
+def filter_json_items(items: list, window: StudyWindow) -> list:
+    """
+    Keeps the items of MyActivity.json within the study window, based on the "time" key
+    """
+    out = []
+    for item in items:
+        timestamp = json_item_timestamp(item)
+        if window.is_before(timestamp):
+            if window.newest_first:
+                break
+            continue
+        if window.is_after(timestamp):
+            continue
+
+        out.append(item)
+        if window.max_rows is not None and len(out) >= window.max_rows:
+            break
+
+    logger.info("Kept %s out of %s items within the study window", len(out), len(items))
+    return out
+
+
+CARD_CLASS = "content-cell mdl-cell mdl-cell--6-col mdl-typography--body-1"
+OUTER_CELL_CLASS = "outer-cell"
+
+
+def parse_card(n, report: parse_report.ParseReport | None = None) -> tuple[str, str, str] | None:
+    """
+    Parses a single activity card into (date, command, response)
+    """
+    return parse_card_nodes(n.xpath("node()"), report)
+
+
+def parse_card_nodes(card_node: list, report: parse_report.ParseReport | None = None) -> tuple[str, str, str] | None:
+    """
+    Parses the child nodes (text and elements) of an activity card into (date, command, response)
+
+    If a report is given, a card that raises an exception is quarantined and None is returned,
+    otherwise the partially parsed card is returned
+    The date (or command) is empty if the card does not end with text (has no text in its link)
+    """
+    date = ""
+    command = ""
+    response = ""
+
+    try:
+        for i, element in enumerate(card_node):
+            if i == 0:
+                command = helpers.fix_latin1_string(element)
+            if hasattr(element, 'tag'):
+                if element.tag == "a":
+                    command = helpers.fix_latin1_string(element.text or "")
+
+                if element.tag == "br" and i < len(card_node) - 2:
+                    to_parse = card_node[i + 1]
+                    if hasattr(to_parse, 'tag'):
+                        text = to_parse.text
+                        response = response + " " + helpers.fix_latin1_string(text)
+                    elif isinstance(to_parse, str):
+                        response = response + " " + helpers.fix_latin1_string(to_parse)
+                    else:
+                        pass
+
+        if response == "":
+            response = "Geen reactie"
+
+        # the date is the text at the end of the card, a card that ends with an element has no date
+        last = card_node.pop()
+        date = "" if hasattr(last, "tag") else last
+    except Exception as e:
+        if report is not None:
+            report.failure(parse_report.FailureCategory.EXCEPTION, type(e).__name__)
+            return None
+        logger.error(e)
+
+    # lxml returns "smart" strings that keep a reference to the tree, convert them to plain strings
+    # commands and responses repeat a lot, interned they are stored once
+    return (str(date), sys.intern(str(command)), sys.intern(str(response)))
+
+
+def iter_cards(html_buf, report: parse_report.ParseReport | None = None) -> Iterator[tuple[str, str, str]]:
+    """
+    Builds the DOM of the whole HTML file and yields the parsed cards
+    """
+    html = html_buf.read()
+    tree = etree.HTML(html)
+    r = tree.xpath(f"//div[@class='{CARD_CLASS}']")
+
+    for n in r:
+        card = parse_card(n, report)
+        if card is not None:
+            yield card
+
+
+def iter_cards_streaming(html_stream, report: parse_report.ParseReport | None = None) -> Iterator[tuple[str, str, str]]:
+    """
+    Parses the HTML file incrementally and yields the parsed cards
+
+    Only the card that is currently parsed is kept in memory,
+    cards that have been parsed are removed from the tree.
+    """
+    context = etree.iterparse(html_stream, events=("end",), tag="div", html=True)
+    for _, element in context:
+        class_name = element.get("class", "")
+
+        if class_name == CARD_CLASS:
+            card = parse_card(element, report)
+            if card is not None:
+                yield card
+
+        elif class_name.startswith(OUTER_CELL_CLASS):
+            element.clear(keep_tail=True)
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+@dataclass
+class Tag:
+    """
+    Element found by the card scanner, stands in for an lxml element in parse_card_nodes
+    """
+    tag: str
+    text: str | None = None
+
+
+class PrefixedStream:
+    """
+    Stream that returns the bytes that were already read before the rest of stream
+    """
+
+    def __init__(self, prefix: bytes, stream) -> None:
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        if not self.prefix:
+            return self.stream.read(size)
+        if size is None or size < 0:
+            out, self.prefix = self.prefix + self.stream.read(), b""
+            return out
+        out, self.prefix = self.prefix[:size], self.prefix[size:]
+        return out
+
+
+CARD_MARKER = CARD_CLASS.encode()
+CARD_OPEN = f'<div class="{CARD_CLASS}">'.encode()
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+RE_CHARSET = re.compile(rb"""charset\s*=\s*["']?([\w-]+)""", re.IGNORECASE)
+RE_DIV_TAG = re.compile(rb"<(/?)div\b[^>]*>", re.IGNORECASE)
+RE_TAG = re.compile(r"<(/?)([a-z]+)(?:\s[^<>]*)?>")
+RE_ENTITY = re.compile(r"&(?:amp|lt|gt|quot|nbsp|emsp|ensp|#\d{2,6}|#x[0-9a-fA-F]{2,6});")
+
+
+RE_REGULAR_CARD = re.compile(r"([^<>]+)<a(?:\s[^<>]*)?>([^<>]+)</a>((?:<br>[^<>]+)+)")
+
+
+def scan_card(inner: bytes) -> tuple[str, str, str] | None:
+    """
+    Parses the markup inside a regular card: prefix <a>command</a><br>response<br>...<br>date
+    Gives the same result as parse_card on the lxml element, returns None for any other card
+    """
+    try:
+        text = inner.decode("utf8")
+    except UnicodeDecodeError:
+        return None
+
+    match = RE_REGULAR_CARD.fullmatch(text)
+    if match is None:
+        return None
+
+    # the text in front of the command is not used, lxml only drops it when it is blank
+    if match.group(1).isspace():
+        return None
+
+    pieces = [_scan_text(piece) for piece in (match.group(2), *match.group(3).split("<br>")[1:])]
+    if None in pieces:
+        return None
+
+    command, *responses, date = pieces
+    response = "".join(" " + helpers.fix_latin1_string(piece) for piece in responses) or "Geen reactie"
+    return (date, sys.intern(helpers.fix_latin1_string(command)), sys.intern(response))
+
+
+def scan_card_nodes(inner: bytes) -> list | None:
+    """
+    Tokenizes the markup inside a card into text and elements, like the child nodes lxml would give
+
+    Only the markup of regular cards (text, <a>text</a> and <br>) is handled,
+    returns None if the card contains anything else so it can be parsed by lxml
+    """
+    try:
+        text = inner.decode("utf8")
+    except UnicodeDecodeError:
+        return None
+
+    nodes: list = []
+    in_anchor = False
+    pos = 0
+    for match in RE_TAG.finditer(text):
+        piece = text[pos:match.start()]
+        pos = match.end()
+        closing, name = match.group(1), match.group(2)
+
+        if piece:
+            piece = _scan_text(piece)
+            if piece is None:
+                return None
+            if in_anchor:
+                nodes[-1].text = piece
+            else:
+                nodes.append(piece)
+
+        if name == "a" and not closing and not in_anchor:
+            nodes.append(Tag("a"))
+            in_anchor = True
+        elif name == "a" and closing and in_anchor:
+            in_anchor = False
+        elif name == "br" and not closing and not in_anchor:
+            nodes.append(Tag("br"))
+        else:
+            return None
+
+    piece = text[pos:]
+    if piece:
+        piece = _scan_text(piece)
+        if piece is None:
+            return None
+        nodes.append(piece)
+
+    # Only cards that start and end with text are parsed the same way as lxml would
+    if in_anchor or not nodes or not isinstance(nodes[0], str) or not isinstance(nodes[-1], str):
+        return None
+
+    return nodes
+
+
+def _scan_text(piece: str) -> str | None:
+    if "<" in piece or "\r" in piece or piece.isspace():
+        return None
+    if "&" in piece:
+        if "&" in RE_ENTITY.sub("", piece):
+            return None
+        piece = html.unescape(piece)
+    return piece
+
+
+def _parse_card_snippet(
+    snippet: bytes, report: parse_report.ParseReport | None = None
+) -> Iterator[tuple[str, str, str]]:
+    tree = etree.HTML(snippet, parser=etree.HTMLParser(encoding="utf8"))
+    if tree is not None:
+        for n in tree.xpath(f"//div[@class='{CARD_CLASS}']"):
+            card = parse_card(n, report)
+            if card is not None:
+                yield card
+
+
+def _card_end(buf: bytes, start: int) -> int:
+    """
+    Returns the end of the div element starting at start, -1 if it does not end in buf
+    """
+    depth = 0
+    for match in RE_DIV_TAG.finditer(buf, start):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            return match.end()
+    return -1
+
+
+def iter_cards_scanning(
+    html_stream, report: parse_report.ParseReport | None = None, chunk_size: int = SCAN_CHUNK_SIZE
+) -> Iterator[tuple[str, str, str]]:
+    """
+    Scans the raw bytes of the HTML file for cards in a single forward pass and yields the parsed cards
+
+    Regular cards are tokenized without building a DOM, which is several times faster than lxml.
+    Cards the scanner cannot handle confidently are parsed with lxml one by one,
+    files that are not UTF-8 encoded are parsed with lxml completely.
+    Only the current chunk of the file is kept in memory.
+    """
+    buf = b""
+    pos = 0
+    eof = False
+    checked_charset = False
+    n_fallbacks = 0
+
+    while not eof:
+        chunk = html_stream.read(chunk_size)
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+        if not checked_charset:
+            first_card = buf.find(CARD_MARKER)
+            charset = RE_CHARSET.search(buf, 0, first_card if first_card >= 0 else len(buf))
+            if charset is None or charset.group(1).lower() not in (b"utf-8", b"utf8"):
+                logger.info("HTML is not declared UTF-8, parsing with lxml")
+                yield from iter_cards_streaming(PrefixedStream(buf, html_stream), report)
+                return
+            checked_charset = True
+
+        while True:
+            i = buf.find(CARD_MARKER, pos)
+            if i < 0:
+                # keep the last tag, it can be a card that continues in the next chunk
+                pos = max(pos, buf.rfind(b"<"))
+                break
+
+            after = i + len(CARD_MARKER)
+            if after + 2 > len(buf) and not eof:
+                pos = max(pos, buf.rfind(b"<", pos, i))
+                break
+
+            # The class of the card should match exactly, "... mdl-typography--text-right" is not a card
+            if buf[after:after + 1] not in (b'"', b"'"):
+                pos = after
+                continue
+
+            start = i - (len(CARD_OPEN) - len(CARD_MARKER) - 2)
+            if start >= 0 and buf[start:after + 2] == CARD_OPEN:
+                end = buf.find(b"</div>", after)
+                if end < 0:
+                    if eof:
+                        pos = after
+                        continue
+                    pos = start
+                    break
+
+                inner = buf[after + 2:end]
+                card = scan_card(inner)
+                nodes = scan_card_nodes(inner) if card is None else None
+                if card is not None or nodes is not None:
+                    if card is None:
+                        card = parse_card_nodes(nodes, report)
+                    if card is not None:
+                        yield card
+                    pos = end + len(b"</div>")
+                    continue
+            else:
+                start = buf.rfind(b"<", 0, i)
+                if start < 0 or buf[start:start + 4].lower() != b"<div":
+                    pos = after
+                    continue
+
+            # The scanner is not confident, parse the card with lxml
+            end = _card_end(buf, start)
+            if end < 0:
+                if eof:
+                    end = len(buf)
+                else:
+                    pos = start
+                    break
+
+            n_fallbacks += 1
+            yield from _parse_card_snippet(buf[start:end], report)
+            pos = end
+
+    if n_fallbacks:
+        logger.info("Parsed %s cards with lxml", n_fallbacks)
+
+
+def check_card(card: tuple[str, str, str]) -> parse_report.FailureCategory | None:
+    """
+    Checks if a parsed card is complete, returns the failure category if it is not
+    """
+    date, command, _ = card
+    if not date:
+        return parse_report.FailureCategory.MISSING_DATE
+    if not command:
+        return parse_report.FailureCategory.MISSING_COMMAND
+    return None
+
+
+def check_json_item(item, report: parse_report.ParseReport) -> bool:
+    """
+    Counts a single item of a JSON activity file in the report, returns False if it is quarantined
+    """
+    if not isinstance(item, dict):
+        report.failure(parse_report.FailureCategory.MALFORMED_ITEM, "Item is not an object")
+    elif not isinstance(item.get("time"), str) or not item["time"]:
+        report.failure(parse_report.FailureCategory.MISSING_DATE, "Item has no time")
+    elif not isinstance(item.get("title"), str):
+        report.failure(parse_report.FailureCategory.MISSING_COMMAND, "Item has no title")
+    else:
+        report.success()
+        return True
+    return False
+
+
+def check_json_items(items, report: parse_report.ParseReport) -> list:
+    """
+    Quarantines the items of a JSON activity file that cannot be parsed
+    """
+    if not isinstance(items, list):
+        report.failure(parse_report.FailureCategory.MALFORMED_ITEM, "The activity is not a list")
+        return []
+
+    out = []
+    for item in items:
+        if check_json_item(item, report):
+            out.append(item)
+
+        if not report.check():
+            break
+
+    return out
+
+
+def google_home_html_to_df(
+    html_buf,
+    budget: memory.MemoryBudget | None = None,
+    language: Language | None = None,
+    window: StudyWindow | None = None,
+    sampler: sampling.Sampler | None = None,
+    report: parse_report.ParseReport | None = None,
+):
     """
     Should work with the HTML of all languages
+
+    html_buf: buffer or stream containing the HTML
+    language: language of the DDP, used to parse the dates
+    window: if given, cards outside the study window are skipped while parsing
+    sampler: if given, cards are sampled while parsing and counted per month
+    budget: if given, rows are capped and sampled when the memory budget is exceeded
+    report: if given, cards that cannot be parsed are quarantined and counted in the report,
+        parsing stops when the error budget of the report is exceeded
     """
 
-    datapoints = []
+    # the cards are streamed, rows are only capped once the memory in use exceeds the budget
+    thinner = memory.RowThinner()
+    normalizer = helpers.DateNormalizer(language=language)
+    filtering = window is not None and window.is_limited
+    n_kept = 0
     try:
-        html = html_buf.read()
-        tree = etree.HTML(html)
-        card_class = "content-cell mdl-cell mdl-cell--6-col mdl-typography--body-1"
-        r = tree.xpath(f"//div[@class='{card_class}']")
-
-        for n in r:
-
-            try:
-                date = ""
-                command = ""
-                response = ""
-                card_node = n.xpath("node()")
-
-                for i, element in enumerate(card_node):
-                    if i == 0:
-                        command = helpers.fix_latin1_string(element)
-                    if hasattr(element, 'tag'):
-                        if element.tag == "a":
-                            command = helpers.fix_latin1_string(element.text)
-
-                        if element.tag == "br" and i < len(card_node) - 2:
-                            to_parse = card_node[i + 1]
-                            if isinstance(to_parse, etree._Element):
-                                text = to_parse.text
-                                response = response + " " + helpers.fix_latin1_string(text)
-                            elif isinstance(to_parse, str):
-                                response = response + " " + helpers.fix_latin1_string(to_parse)
-                            else:
-                                pass
-
-                if response == "":
-                    response = "Geen reactie"
-
-                date = card_node.pop()
-            except Exception as e:
-                logger.error(e)
-
-            datapoints.append(
-                (date, command, response)
-            )
+        cards = iter_cards_scanning(html_buf, report)
+        for datapoint in cards:
+            if report is not None:
+                if not report.check():
+                    break
+                failure = check_card(datapoint)
+                if failure is not None:
+                    report.failure(failure, "Incomplete card")
+                    continue
+                report.success()
+
+            if filtering or sampler is not None:
+                timestamp = normalizer.parse(datapoint[0])
+
+            if filtering:
+                if window.is_before(timestamp):
+                    if window.newest_first:
+                        logger.info("Reached the start of the study window, stopped parsing")
+                        break
+                    continue
+                if window.is_after(timestamp):
+                    continue
+
+            if sampler is not None:
+                sampler.add(datapoint, month_of(timestamp))
+            else:
+                thinner.add(datapoint)
+            n_kept += 1
+            if window is not None and window.max_rows is not None and n_kept >= window.max_rows:
+                logger.info("Reached the maximum number of rows, stopped parsing")
+                break
+
+            if (
+                budget is not None
+                and sampler is None
+                and thinner.max_rows is None
+                and thinner.n_seen % budget.check_every == 0
+                and budget.exceeded()
+            ):
+                budget.degrade(f"Memory budget exceeded after {thinner.n_seen} cards, rows are sampled")
+                thinner.cap(budget.max_rows)
+
     except Exception as e:
+        # the cards that were parsed before the error are kept
+        if report is not None:
+            report.failure(parse_report.FailureCategory.READ_ERROR, type(e).__name__)
         logger.error(e)
 
-    out = pd.DataFrame(datapoints, columns=["Dag en tijd", "Uw commando", "Reactie van de assistent"])
+    if budget is not None and thinner.thinned:
+        budget.degrade(f"Kept {len(thinner.rows)} out of {thinner.n_seen} cards (every {thinner.stride}th card)")
+
+    if sampler is not None and sampler.sampled:
+        logger.info("Sampled %s out of %s cards", sampler.n_kept, sampler.n_seen)
+
+    rows = sampler.rows() if sampler is not None else thinner.rows
+    out = pd.DataFrame(rows, columns=["Dag en tijd", "Uw commando", "Reactie van de assistent"])
+    # Convert the localized dates (e.g. "12 mrt 2024, 10:15:02 CET") to the representation shared with the JSON path
+    out["Dag en tijd"] = helpers.normalize_datetime_column(out["Dag en tijd"], normalizer)
     return out
 
 
+# Activity files per file name: (file type, language of the DDP)
 
-def google_home_to_df(google_home_zip: str, validation: ValidateInput) -> pd.DataFrame:
 
-    out = pd.DataFrame()
+ACTIVITY_FILES: dict[str, tuple[DDPFiletype, Language]] = {
+    "MyActivity.html": (DDPFiletype.HTML, Language.NL),
+    "My Activity.html": (DDPFiletype.HTML, Language.EN),
+    "MeineAktivitäten.html": (DDPFiletype.HTML, Language.DE),
+    "MyActivity.json": (DDPFiletype.JSON, Language.NL),
+    "My Activity.json": (DDPFiletype.JSON, Language.EN),
+    "MeineAktivitäten.json": (DDPFiletype.JSON, Language.DE),
+}
+
+# Product folder of the activity files, My Activity exports every Google product with the same file names
+ASSISTANT_FOLDERS = {"assistant", "assistent"}
+
+
+@dataclass
+class ActivitySource:
+    """
+    Activity file in a DDP
+
+    Attributes:
+        path: path of the file in the zip
+        ddp_filetype: HTML or JSON
+        language: language of the DDP the file belongs to
+    """
+    path: str
+    ddp_filetype: DDPFiletype
+    language: Language
+
+
+def prioritize_activity_sources(paths: list[str], validation: ValidateInput) -> list[ActivitySource]:
+    """
+    Returns the Assistant activity files among paths, the file matching the detected DDP category comes first
+
+    If the DDP contains Assistant product folders, activity files of other products (Search, YouTube, ...) are skipped.
+    Otherwise (e.g. an activity file at the root of the zip) the activity files matching the DDP category are used.
+    """
+    category = validation.ddp_category
 
-    # CODE FOR HTML 
-    if validation.ddp_category.ddp_filetype == DDPFiletype.HTML:
-        file_name = "MyActivity.html" # this is the dutch file name
+    def matches_category(source: ActivitySource) -> bool:
+        return source.ddp_filetype == category.ddp_filetype and source.language == category.language
 
-        if validation.ddp_category.language == Language.DE:
-            file_name = "MeineAktivitäten.html"
+    sources = [
+        ActivitySource(f, *ACTIVITY_FILES[Path(f).name])
+        for f in paths if Path(f).name in ACTIVITY_FILES
+    ]
+    assistant_sources = [s for s in sources if Path(s.path).parent.name.casefold() in ASSISTANT_FOLDERS]
+    if assistant_sources:
+        logger.debug("Skipped %s activity files of other products", len(sources) - len(assistant_sources))
+        sources = assistant_sources
+    elif category is not None:
+        logger.debug("No Assistant product folder, using the activity files matching the DDP category")
+        sources = [s for s in sources if matches_category(s)]
 
-        if validation.ddp_category.language == Language.EN:
-            file_name = "My Activity.html"
+    if category is not None:
+        sources.sort(key=lambda source: not matches_category(source))
+    return sources
+
+
+def find_activity_sources(google_home_zip: str, validation: ValidateInput) -> list[ActivitySource]:
+    """
+    Lists all activity files in the zip, the file matching the detected DDP category comes first
+    """
+    try:
+        return prioritize_activity_sources(unzipddp.namelist(google_home_zip), validation)
+    except Exception as e:
+        logger.error("Could not list the files in the zip: %s", e)
+        return []
+
+
+def stream_json_items(
+    stream: IO[bytes],
+    budget: memory.MemoryBudget | None = None,
+    window: StudyWindow | None = None,
+    sampler: sampling.Sampler | None = None,
+    report: parse_report.ParseReport | None = None,
+) -> list:
+    """
+    Reads the items of a JSON activity file one at a time, for files that are sampled or do not fit in memory
+    Items are checked, filtered on the study window and sampled (or thinned to budget.max_rows) while they are read
+    """
+    thinner = memory.RowThinner(budget.max_rows if budget is not None else None)
+    filtering = window is not None and window.is_limited
+    n_kept = 0
+
+    try:
+        for item in unzipddp.iter_json_array(stream):
+            if report is not None:
+                if not report.check():
+                    break
+                if not check_json_item(item, report):
+                    continue
+
+            if filtering:
+                timestamp = json_item_timestamp(item)
+                if window.is_before(timestamp):
+                    if window.newest_first:
+                        logger.info("Reached the start of the study window, stopped parsing")
+                        break
+                    continue
+                if window.is_after(timestamp):
+                    continue
+
+            if sampler is not None:
+                sampler.add(item, json_item_month(item))
+            else:
+                thinner.add(item)
+            n_kept += 1
+            if window is not None and window.max_rows is not None and n_kept >= window.max_rows:
+                logger.info("Reached the maximum number of rows, stopped parsing")
+                break
+
+    except Exception as e:
+        # the items that were read before the error are kept
+        if report is not None:
+            report.failure(parse_report.FailureCategory.READ_ERROR, type(e).__name__)
+        logger.error("Could not read the JSON activity: %s", e)
 
-        buf = unzipddp.extract_file_from_zip(google_home_zip, file_name)
-        out = google_home_html_to_df(buf)
+    if sampler is not None:
+        return sampler.rows()
 
+    if budget is not None and thinner.thinned:
+        budget.degrade(f"Kept {len(thinner.rows)} out of {thinner.n_seen} items (every {thinner.stride}th item)")
+    return thinner.rows
+
+
+def activity_stream_to_df(
+    stream: IO[bytes],
+    source: ActivitySource,
+    file_size: int,
+    budget: memory.MemoryBudget | None = None,
+    window: StudyWindow | None = None,
+    sampler: sampling.Sampler | None = None,
+    report: parse_report.ParseReport | None = None,
+) -> pd.DataFrame:
+    """
+    Extracts the Google Assistant activity of a single activity file
+    stream: the decompressed activity file, file_size: its uncompressed size in bytes
+    """
+    out = pd.DataFrame()
+    file_name = source.path
+    language = source.language
+
+    # CODE FOR HTML
+    if source.ddp_filetype == DDPFiletype.HTML:
+        # The HTML is scanned while it is decompressed, it is never fully loaded in memory
+        # whether rows are sampled depends on the memory in use while parsing, not on the size of the file
+        out = google_home_html_to_df(stream, budget, language=language, window=window, sampler=sampler, report=report)
 
     # CODE FOR JSON NOT TESTED YET
-    if validation.ddp_category.ddp_filetype == DDPFiletype.JSON:
-        file_name = "MyActivity.json" # this is the dutch file name
+    too_large = budget is not None and not budget.fits(file_size)
+    if source.ddp_filetype == DDPFiletype.JSON and (too_large or sampler is not None):
+        # The file is read item by item, only the kept (or sampled) items are in memory
+        if too_large:
+            budget.degrade(f"{Path(file_name).name} is too large to process in memory, items are sampled")
+        json = stream_json_items(stream, budget if too_large else None, window, sampler, report)
+        df = json_data_to_dataframe(json)
+        out = clean_extracted_data(df, language)
+
+    elif source.ddp_filetype == DDPFiletype.JSON:
+        json = unzipddp.read_json_from_bytes(io.BytesIO(stream.read()))
+
+        if report is not None:
+            json = check_json_items(json, report)
 
-        if validation.ddp_category.language == Language.DE:
-            file_name = "MeineAktivitäten.json"
+        if window is not None and window.is_limited and isinstance(json, list):
+            json = filter_json_items(json, window)
+
+        if (
+            budget is not None
+            and isinstance(json, list)
+            and len(json) > budget.max_rows
+            and budget.exceeded()
+        ):
+            thinner = memory.RowThinner(budget.max_rows)
+            for item in json:
+                thinner.add(item)
+            budget.degrade(f"Memory budget exceeded, kept {len(thinner.rows)} out of {thinner.n_seen} items")
+            json = thinner.rows
 
-        buf = unzipddp.extract_file_from_zip(google_home_zip, file_name)
-        json = unzipddp.read_json_from_bytes(buf)
         df = json_data_to_dataframe(json)
-        out = clean_extracted_data(df)
+        out = clean_extracted_data(df, language)
+
+    return out
+
+
+NO_RESPONSE = "Geen reactie"
+
+
+def activity_keys(df: pd.DataFrame) -> pd.Series:
+    """
+    Hashes the normalized (timestamp, command) of every interaction to a single uint64
+
+    Commands are compared case and whitespace insensitive. Identical interactions
+    within a file are numbered, so repeated commands in the same second are not merged.
+    """
+    command = df["Uw commando"].astype(str).str.casefold().str.split().str.join(" ")
+    keys = pd.DataFrame({"time": df["Dag en tijd"].astype(str), "command": command})
+    keys["occurrence"] = keys.groupby(["time", "command"], sort=False).cumcount()
+    return pd.util.hash_pandas_object(keys, index=False)
+
+
+def activity_richness(df: pd.DataFrame) -> pd.Series:
+    """
+    Scores how complete every interaction is: a response counts more than the length of the texts
+    """
+    response = df["Reactie van de assistent"].fillna("").astype(str).str.strip()
+    has_response = (response.ne("") & response.ne(NO_RESPONSE)).astype(int)
+    length = response.str.len() + df["Uw commando"].fillna("").astype(str).str.len()
+    return has_response * 1_000_000 + length
+
+
+def merge_activity(merged: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the interactions of df to merged, interactions already in merged are deduplicated
+    and the richest version of every interaction is kept, ties are won by merged
+
+    Memory use is proportional to the number of unique interactions, not the number of files.
+    Returns the interactions newest first.
+    """
+    if merged.empty:
+        return df
+    if df.empty:
+        return merged
+
+    out = pd.concat([merged, df], ignore_index=True)
+    key = pd.concat([activity_keys(merged), activity_keys(df)], ignore_index=True)
+    richness = activity_richness(out)
+
+    order = pd.DataFrame({"key": key, "richness": richness}).sort_values(
+        ["key", "richness"], ascending=[True, False], kind="stable"
+    )
+    keep = order.index[~order["key"].duplicated()]
+    out = out.loc[keep.sort_values()]
+
+    n_duplicates = len(merged) + len(df) - len(out)
+    if n_duplicates:
+        logger.info("Removed %s duplicate interactions", n_duplicates)
+
+    return out.sort_values("Dag en tijd", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def plan_activity(
+    plan: extraction_plan.ExtractionPlan,
+    validation: ValidateInput,
+    budget: memory.MemoryBudget | None = None,
+    window: StudyWindow | None = None,
+    sampler: sampling.Sampler | None = None,
+    report: parse_report.ParseReport | None = None,
+) -> extraction_plan.MemberRequest:
+    """
+    Requests the activity files of a DDP from the extraction plan, see google_home_to_df
+    After the plan has run, the activity is merged with planned_activity_to_df
+    """
+    sources: dict[str, ActivitySource] = {}
+
+    def select(paths: list[str]) -> list[str]:
+        prioritized = prioritize_activity_sources(paths, validation)
+        if sampler is not None:
+            prioritized = prioritized[:1]
+        sources.update((source.path, source) for source in prioritized)
+        return [source.path for source in prioritized]
+
+    def parse(stream: IO[bytes], member: extraction_plan.PlannedMember) -> pd.DataFrame:
+        logger.debug("Extracting %s", member.path)
+        if report is not None:
+            report.source = member.path
+        return activity_stream_to_df(stream, sources[member.path], member.file_size, budget, window, sampler, report)
+
+    return plan.request(tuple(ACTIVITY_FILES), parse, select)
+
+
+def planned_activity_to_df(
+    request: extraction_plan.MemberRequest,
+    report: parse_report.ParseReport | None = None,
+) -> pd.DataFrame:
+    """
+    Merges the activity files read by the plan without duplicates, in order of priority
+    """
+    out = pd.DataFrame()
+
+    if not request.selected:
+        logger.error("No activity file found")
+        return out
+
+    for path in request.selected:
+        df = request.results.get(path, pd.DataFrame())
+        if {"Dag en tijd", "Uw commando", "Reactie van de assistent"} <= set(df.columns):
+            out = merge_activity(out, df)
+        else:
+            logger.error("Could not extract %s", path)
+            if report is not None:
+                report.source = path
+                report.failure(parse_report.FailureCategory.READ_ERROR, f"Could not extract {path}")
+
+    # Commands and responses repeat a lot, store every unique value once
+    return helpers.to_categorical_columns(out, ["Uw commando", "Reactie van de assistent"])
+
+
+def google_home_to_df(
+    google_home_zip: str,
+    validation: ValidateInput,
+    budget: memory.MemoryBudget | None = None,
+    window: StudyWindow | None = None,
+    sampler: sampling.Sampler | None = None,
+    report: parse_report.ParseReport | None = None,
+) -> pd.DataFrame:
+    """
+    Extracts the Google Assistant activity of a DDP
+
+    Every activity file in the DDP is parsed (HTML and JSON exports, multi part exports)
+    in a single pass over the zip and merged without duplicates.
+    If a memory budget is given and an activity file is estimated not to fit, rows are sampled.
+    If a study window is given, only the activity within the window is parsed.
+    If a sampler is given, the activity is sampled while it is parsed,
+    only the file matching the detected DDP category is used so interactions are not counted twice.
+    If a parse report is given, items that cannot be parsed are quarantined and counted in the report.
+    """
+    plan = extraction_plan.ExtractionPlan()
+    activity = plan_activity(plan, validation, budget, window, sampler, report)
+    plan.run(google_home_zip, budget)
+    return planned_activity_to_df(activity, report)
+
+
+def google_home_sessions_to_df(df: pd.DataFrame, gap: pd.Timedelta) -> pd.DataFrame:
+    """
+    Groups the interactions in df (output of google_home_to_df) into conversations
+    A conversation ends when there are no interactions for longer than gap
+
+    Returns one row per conversation: start, duration, number of commands and the first command
+    """
+    columns = ["Gesprek", "Begin", "Duur (seconden)", "Aantal commando's", "Eerste commando"]
+    out = pd.DataFrame(columns=columns)
+
+    try:
+        interactions = pd.DataFrame({
+            "datetime": helpers.parse_display_datetime_column(df["Dag en tijd"]),
+            "command": df["Uw commando"],
+        })
+        interactions["session"] = helpers.assign_sessions(interactions["datetime"], gap)
+        interactions = interactions.dropna(subset=["session"]).sort_values("datetime", kind="stable")
+
+        if not interactions.empty:
+            grouped = interactions.groupby("session", sort=True)
+            start = grouped["datetime"].min()
+            end = grouped["datetime"].max()
+
+            out = pd.DataFrame({
+                "Gesprek": start.index.astype(int),
+                "Begin": helpers.format_datetime_column(start).to_numpy(),
+                "Duur (seconden)": (end - start).dt.total_seconds().astype(int).to_numpy(),
+                "Aantal commando's": grouped.size().to_numpy(),
+                "Eerste commando": grouped["command"].first().to_numpy(),
+            })
+            out = out.iloc[::-1].reset_index(drop=True)
+
+    except Exception as e:
+        logger.error("Could not create sessions: %s", e)
 
     return out
 
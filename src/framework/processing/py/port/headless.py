@@ -0,0 +1,231 @@
+"""
+Headless driver for the donation flow
+
+Drives the process() generator the same way py_worker.js does, but without the browser,
+fake_bridge.ts and the React UI. User input is taken from a list of scripted payloads.
+Every emitted command is recorded together with its serialized size and the time spent in the cycle,
+so a full session can be benchmarked and profiled on CPython.
+
+Example:
+
+    python -m port.headless takeout.zip
+    python -m port.headless takeout.zip --decline --profile session.prof
+"""
+from dataclasses import dataclass
+from typing import Any, Iterable
+import argparse
+import cProfile
+import json
+import logging
+import sys
+import time
+
+import pandas as pd
+
+from port.main import start
+
+logger = logging.getLogger(__name__)
+
+
+class Payload:
+    """
+    Python stand-in for the payloads the UI resolves with (see types/commands.ts)
+    The script reads payloads by attribute, just like the JsProxy objects in Pyodide
+    """
+
+    __slots__ = "__type__", "value"
+
+    def __init__(self, type: str, value: Any = None):
+        self.__type__ = type
+        self.value = value
+
+    def __repr__(self) -> str:
+        return f"Payload({self.__type__!r})"
+
+
+CONSENT_ALL = "ConsentAll"
+
+
+def payload_file(path: str) -> Payload:
+    """The participant selected a file, py_worker.js hands the script the path in the file system"""
+    return Payload("PayloadString", path)
+
+
+def payload_json(value: str) -> Payload:
+    return Payload("PayloadJSON", value)
+
+
+def payload_true() -> Payload:
+    return Payload("PayloadTrue", True)
+
+
+def payload_false() -> Payload:
+    return Payload("PayloadFalse", False)
+
+
+def payload_consent_all() -> Payload:
+    """The participant donates every row of every table on the consent page"""
+    return Payload(CONSENT_ALL)
+
+
+@dataclass
+class CycleRecord:
+    """
+    Single cycle of the flow
+
+    Attributes:
+        cycle: index of the cycle, the commands of a batch share their cycle
+        command: type of the command emitted by the script
+        detail: page body type for renders, the key for donations
+        size: size in bytes of the command serialized to JSON
+        seconds: time spent in the script during the cycle, recorded on the last command of a batch
+        payload: the payload the script was resumed with
+    """
+
+    cycle: int
+    command: str
+    detail: str
+    size: int
+    seconds: float
+    payload: str
+
+
+def decode_data_frame(columns: dict[str, Any]) -> dict[str, Any]:
+    """
+    Decodes the dictionary encoded columns of a serialized table the way consent_form.tsx does
+    """
+    out = {}
+    for column, data in columns.items():
+        if isinstance(data, dict) and "dictionary" in data and "codes" in data:
+            dictionary = data["dictionary"]
+            data = {str(row): dictionary[code] if code >= 0 else None for row, code in enumerate(data["codes"])}
+        out[column] = data
+    return out
+
+
+def consent_from_page(page: dict[str, Any]) -> str:
+    """
+    Serializes the tables of a rendered consent form the way consent_form.tsx does
+    """
+    body = page.get("body", {})
+    tables = body.get("tables", []) + body.get("metaTables", [])
+
+    out = []
+    for table in tables:
+        data_frame = table["data_frame"]
+        columns = decode_data_frame(json.loads(data_frame) if isinstance(data_frame, str) else data_frame)
+        rows = pd.DataFrame(columns).astype(str).to_dict(orient="records")
+        out.append({table["id"]: rows})
+    out.append({"user_omissions": "[]"})
+
+    return json.dumps(out)
+
+
+def _describe(command: dict[str, Any]) -> str:
+    if command["__type__"] == "CommandUIRender":
+        page = command["page"]
+        body = page.get("body")
+        return body["__type__"] if isinstance(body, dict) else page["__type__"]
+    if command["__type__"] == "CommandSystemDonate":
+        return command["key"]
+    return command.get("info", "")
+
+
+def run_session(
+    session_id: str | int,
+    payloads: Iterable[Payload],
+    max_cycles: int = 10_000,
+    batching: bool = True,
+    json_bytes: bool = True,
+) -> list[CycleRecord]:
+    """
+    Runs a complete session and records every command of every cycle
+
+    The session ends when the script exits, the end page is rendered,
+    or the script asks for input after the scripted payloads are used up.
+    """
+    script = start(session_id, batching, json_bytes)
+    scripted = iter(payloads)
+    records: list[CycleRecord] = []
+
+    payload: Payload | None = None
+    for cycle in range(max_cycles):
+        t0 = time.perf_counter()
+        command = script.send(payload)
+        if isinstance(command, bytes):
+            # py_worker.js does JSON.parse on the buffer
+            command = json.loads(command)
+        seconds = time.perf_counter() - t0
+
+        commands = command["commands"] if command["__type__"] == "CommandBatch" else [command]
+        for i, command in enumerate(commands):
+            size = len(json.dumps(command).encode("utf8"))
+            records.append(CycleRecord(
+                cycle, command["__type__"], _describe(command), size,
+                seconds if i == len(commands) - 1 else 0.0, repr(payload),
+            ))
+
+        if command["__type__"] == "CommandSystemExit":
+            break
+
+        if command["__type__"] == "CommandUIRender":
+            if command["page"]["__type__"] == "PropsUIPageEnd":
+                break
+
+            payload = next(scripted, None)
+            if payload is None:
+                logger.info("Scripted payloads used up at cycle %s", cycle)
+                break
+
+            if payload.__type__ == CONSENT_ALL:
+                payload = payload_json(consent_from_page(command["page"]))
+        else:
+            payload = Payload("PayloadVoid")
+
+    return records
+
+
+def summarize(records: list[CycleRecord]) -> pd.DataFrame:
+    return pd.DataFrame([record.__dict__ for record in records])
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the donation flow headless with scripted payloads")
+    parser.add_argument("file", help="DDP to submit at the file prompt")
+    parser.add_argument("--session-id", default="1")
+    parser.add_argument("--decline", action="store_true", help="decline instead of donating at the consent page")
+    parser.add_argument(
+        "--payloads", help="JSON file with a list of {__type__, value} payloads, overrides the default flow"
+    )
+    parser.add_argument("--profile", help="write cProfile stats of the session to this file")
+    parser.add_argument("--no-batching", action="store_true", help="send every command in its own cycle")
+    parser.add_argument("--dicts", action="store_true", help="return commands as dicts (toJs) instead of JSON buffers")
+    args = parser.parse_args(argv)
+
+    if args.payloads:
+        with open(args.payloads, "r", encoding="utf8") as f:
+            payloads = [Payload(p["__type__"], p.get("value")) for p in json.load(f)]
+    else:
+        consent = payload_false() if args.decline else payload_consent_all()
+        payloads = [payload_file(args.file), consent, payload_json("{}")]
+
+    if args.profile:
+        profiler = cProfile.Profile()
+        records = profiler.runcall(
+            run_session, args.session_id, payloads, batching=not args.no_batching, json_bytes=not args.dicts
+        )
+        profiler.dump_stats(args.profile)
+    else:
+        records = run_session(args.session_id, payloads, batching=not args.no_batching, json_bytes=not args.dicts)
+
+    summary = summarize(records)
+    print(summary[["cycle", "command", "detail", "size", "seconds"]].to_string(index=False))
+    print(
+        f"cycles: {summary['cycle'].nunique()}, commands: {len(summary)}, "
+        f"bytes: {summary['size'].sum()}, seconds: {summary['seconds'].sum():.3f}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
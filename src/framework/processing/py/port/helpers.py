@@ -1,7 +1,9 @@
-from datetime import datetime, timezone
-from typing import Any
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Any, Iterator
 import warnings
 import math
+import sys
 import logging
 import re
 
@@ -9,11 +11,23 @@ from dateutil.parser import parse
 import pandas as pd
 import numpy as np
 
+from port.validate import Language
+
 logger = logging.getLogger(__name__)
 
 REGEX_ISO8601_FULL = r"^(-?(?:[1-9][0-9]*)?[0-9]{4})-(1[0-2]|0[1-9])-(3[01]|0[1-9]|[12][0-9])T(2[0-3]|[01][0-9]):([0-5][0-9]):([0-5][0-9])(\.[0-9]+)?(Z|[+-](?:2[0-3]|[01][0-9]):[0-5][0-9])?$"
 REGEX_ISO8601_DATE = r"^(-?(?:[1-9][0-9]*)?[0-9]{4})-(1[0-2]|0[1-9])-(3[01]|0[1-9]|[12][0-9])$"
 
+RE_ISO8601_FULL = re.compile(REGEX_ISO8601_FULL)
+RE_ISO8601_DATE = re.compile(REGEX_ISO8601_DATE)
+
+# Epoch time (unit seconds) between the start of the year 2000 and the year 2040
+EPOCH_YEAR2000 = 946684800
+EPOCH_YEAR2040 = 2208988800
+
+# pandas >= 2 infers a single format from the first element, "ISO8601" allows for variations
+ISO8601_FORMAT = "ISO8601" if int(pd.__version__.split(".")[0]) >= 2 else None
+
 
 def split_dataframe(df: pd.DataFrame, row_count: int) -> list[pd.DataFrame]:
     """
@@ -21,15 +35,72 @@ def split_dataframe(df: pd.DataFrame, row_count: int) -> list[pd.DataFrame]:
     Has to be expected. Solution split tables into smaller tables.
     I have tried non-bespoke table soluions they did not perform any better
 
-    I hope you have an idea to make tables faster! Would be nice
+    Every chunk is a copy with a new index (0, 1, 2, ...).
+    Unlike iter_dataframe_chunks, which creates the chunks on demand as views that keep the index of df
+    """
+    return [chunk.reset_index(drop=True) for chunk in iter_dataframe_chunks(df, row_count=row_count)]
+
+
+def chunk_ranges(n_rows: int, row_count: int) -> Iterator[tuple[int, int]]:
+    """
+    Yields (start, stop) row ranges of at most row_count rows covering n_rows rows
+    """
+    row_count = max(int(row_count), 1)
+    for start in range(0, n_rows, row_count):
+        yield start, min(start + row_count, n_rows)
+
+
+def estimate_row_bytes(df: pd.DataFrame, sample_size: int = 100) -> float:
+    """
+    Estimates the number of bytes per row of df serialized with DataFrame.to_json()
+    the serialization used by props.PropsUIPromptConsentFormTable
+    """
+    if len(df) == 0:
+        return 0.0
+
+    step = max(len(df) // sample_size, 1)
+    sample = df.iloc[::step]
+    return len(sample.to_json().encode("utf8")) / len(sample)
+
+
+def iter_dataframe_chunks(
+    df: pd.DataFrame, row_count: int | None = None, max_bytes: int | None = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Lazily yields consecutive chunks of df, every chunk is a view (no data is copied)
+
+    Chunks contain at most row_count rows, and when max_bytes is given
+    at most the number of rows that is estimated to serialize to max_bytes.
     """
-    # Calculate the number of splits needed.
-    num_splits = int(len(df) / row_count) + (len(df) % row_count > 0)
+    rows = len(df) if row_count is None else row_count
+
+    if max_bytes is not None:
+        row_bytes = estimate_row_bytes(df)
+        if row_bytes > 0:
+            rows = min(rows, int(max_bytes // row_bytes))
 
-    # Split the DataFrame into chunks of size row_count.
-    df_splits = [df[i*row_count:(i+1)*row_count].reset_index(drop=True) for i in range(num_splits)]
+    for start, stop in chunk_ranges(len(df), rows):
+        yield df.iloc[start:stop]
 
-    return df_splits
+
+def to_categorical_columns(
+    df: pd.DataFrame, columns: list[str] | None = None, max_unique_ratio: float = 0.5
+) -> pd.DataFrame:
+    """
+    Converts repetitive string columns to categorical (dictionary encoded) columns
+    Every unique string is stored once, the rows only store a small integer code
+
+    Columns with more than max_unique_ratio unique values per row are left as is.
+    """
+    out = df
+    for column in df.columns if columns is None else columns:
+        if column not in df.columns or df[column].dtype != object or len(df) == 0:
+            continue
+        if df[column].nunique(dropna=True) <= max_unique_ratio * len(df):
+            if out is df:
+                out = df.copy(deep=False)
+            out[column] = df[column].astype("category")
+    return out
 
 
 class CannotConvertEpochTimestamp(Exception):
@@ -83,9 +154,9 @@ def is_isoformat(
     """
 
     regex = (
-        REGEX_ISO8601_FULL
+        RE_ISO8601_FULL
         if date_only is False
-        else REGEX_ISO8601_DATE
+        else RE_ISO8601_DATE
     )
 
     try:
@@ -98,7 +169,7 @@ def is_isoformat(
                 )
                 return False
 
-            if re.fullmatch(regex, datetime_str[i]) is None:  # type: ignore
+            if regex.fullmatch(datetime_str[i]) is None:  # type: ignore
                 logger.debug(
                     "Could not detect ISO 8601 timestamp (date_only=%s): %s",
                     date_only,
@@ -125,13 +196,10 @@ def is_epoch(datetime_int: list[int] | list[str], check_minimum: int) -> bool:
     epoch time (unit seconds) fall between the start of year 2000 and the year 2040
     """
 
-    year2000 = 946684800
-    year2040 = 2208988800
-
     try:
         for i in range(min(len(datetime_int), check_minimum)):
             check_time = int(datetime_int[i])
-            if not year2000 <= check_time <= year2040:
+            if not EPOCH_YEAR2000 <= check_time <= EPOCH_YEAR2040:
                 logger.debug("Could not detect epoch time timestamp: %s", check_time)
                 return False
 
@@ -143,6 +211,71 @@ def is_epoch(datetime_int: list[int] | list[str], check_minimum: int) -> bool:
     return True
 
 
+class TimestampType(Enum):
+    """ Types of timestamp columns """
+    ISO8601 = 1
+    DATE = 2
+    EPOCH_S = 3
+    EPOCH_MS = 4
+    TEXT = 5
+
+
+def infer_timestamp_type(series: pd.Series, sample_size: int = 100) -> TimestampType:
+    """
+    Classifies a column as ISO 8601, date only ISO 8601, epoch (seconds or milliseconds) or free text
+    Only a sample of at most sample_size non empty values is inspected, all values in the sample should agree
+    """
+    sample = series.dropna()
+    if len(sample) > sample_size:
+        sample = sample.iloc[:: len(sample) // sample_size][:sample_size]
+
+    if len(sample) == 0:
+        return TimestampType.TEXT
+
+    numbers = pd.to_numeric(sample, errors="coerce")
+    if numbers.notna().all():
+        if numbers.between(EPOCH_YEAR2000, EPOCH_YEAR2040).all():
+            logger.debug("Epoch timestamp (seconds) column detected")
+            return TimestampType.EPOCH_S
+        if numbers.between(EPOCH_YEAR2000 * 1000, EPOCH_YEAR2040 * 1000).all():
+            logger.debug("Epoch timestamp (milliseconds) column detected")
+            return TimestampType.EPOCH_MS
+        return TimestampType.TEXT
+
+    strings = sample.astype(str)
+    if strings.str.fullmatch(RE_ISO8601_FULL).all():
+        logger.debug("ISO 8601 timestamp column detected")
+        return TimestampType.ISO8601
+    if strings.str.fullmatch(RE_ISO8601_DATE).all():
+        logger.debug("ISO 8601 date column detected")
+        return TimestampType.DATE
+
+    logger.debug("Could not detect timestamp column")
+    return TimestampType.TEXT
+
+
+def to_datetime_column(series: pd.Series, timestamp_type: TimestampType | None = None) -> pd.Series:
+    """
+    Converts a whole column to datetime64 (UTC), values that cannot be converted become NaT
+    If timestamp_type is not given it is inferred with infer_timestamp_type
+    """
+    if timestamp_type is None:
+        timestamp_type = infer_timestamp_type(series)
+
+    if timestamp_type == TimestampType.ISO8601:
+        return pd.to_datetime(series, utc=True, errors="coerce", format=ISO8601_FORMAT)
+
+    if timestamp_type == TimestampType.DATE:
+        return pd.to_datetime(series, utc=True, errors="coerce", format="%Y-%m-%d")
+
+    if timestamp_type in (TimestampType.EPOCH_S, TimestampType.EPOCH_MS):
+        unit = "s" if timestamp_type == TimestampType.EPOCH_S else "ms"
+        return pd.to_datetime(pd.to_numeric(series, errors="coerce"), unit=unit, utc=True, errors="coerce")
+
+    logger.debug("Cannot convert free text column to datetime")
+    return pd.Series(pd.NaT, index=series.index, dtype="datetime64[ns, UTC]")
+
+
 def epoch_to_iso(epoch_timestamp: str | int) -> str:
     """
     Convert epoch timestamp to an ISO 8601 string. Assumes UTC.
@@ -159,6 +292,47 @@ def epoch_to_iso(epoch_timestamp: str | int) -> str:
 
     return out
 
+
+def epoch_to_iso_column(epoch_timestamps: pd.Series) -> pd.Series:
+    """
+    Vectorized epoch_to_iso: converts a column of epoch timestamps (unit seconds) to ISO 8601 strings. Assumes UTC.
+    Values that cannot be converted are returned as string unchanged
+    """
+    converted = pd.to_datetime(pd.to_numeric(epoch_timestamps, errors="coerce"), unit="s", utc=True, errors="coerce")
+    out = converted.dt.strftime("%Y-%m-%dT%H:%M:%S+00:00")
+    return out.where(converted.notna(), epoch_timestamps.astype(str))
+
+
+def _children(inp: dict[Any, Any] | list[Any]):
+    return inp.items() if isinstance(inp, dict) else enumerate(inp)
+
+
+def iter_denested(inp: Any, name: str = "") -> Iterator[tuple[str, int, Any]]:
+    """
+    Denests a dict or list without recursion
+    Yields (key, depth, value) in the order of dict_denester, keys are interned
+    the depth is the number of "-" in the key
+    """
+    if not isinstance(inp, (dict, list)):
+        key = sys.intern(name[1:])
+        yield key, key.count("-"), inp
+        return
+
+    stack = [(name, iter(_children(inp)))]
+    while stack:
+        prefix, children = stack[-1]
+        for k, v in children:
+            newname = f"{prefix}-{k}"
+            if isinstance(v, (dict, list)):
+                stack.append((newname, iter(_children(v))))
+                break
+
+            key = sys.intern(newname[1:])
+            yield key, key.count("-"), v
+        else:
+            stack.pop()
+
+
 def dict_denester(
     inp: dict[Any, Any] | list[Any],
     new: dict[Any, Any] | None = None,
@@ -169,31 +343,95 @@ def dict_denester(
     Denest a dict or list, returns a new denested dict
     """
 
-    if run_first:
+    if run_first or new is None:
         new = {}
 
-    if isinstance(inp, dict):
-        for k, v in inp.items():
-            if isinstance(v, (dict, list)):
-                dict_denester(v, new, f"{name}-{str(k)}", run_first=False)
-            else:
-                newname = f"{name}-{k}"
-                new.update({newname[1:]: v})  # type: ignore
+    for key, _, value in iter_denested(inp, name):
+        new[key] = value
 
-    elif isinstance(inp, list):
-        for i, item in enumerate(inp):
-            dict_denester(item, new, f"{name}-{i}", run_first=False)
+    return new
 
-    else:
-        new.update({name[1:]: inp})  # type: ignore
 
-    return new  # type: ignore
+class DenestedIndex:
+    """
+    Index on the keys of a denested dict for repeated lookups
+
+    find has the semantics of find_items: the value of the least nested key that contains key_to_match.
+    For every part of a key (the key split on "-") the least nested key containing that part is stored,
+    a lookup only has to consider the distinct key parts instead of every key, results are memoized.
+
+    find_suffix is a single dict lookup: the value of the least nested key that ends in key_to_match
+    as whole key parts (e.g. "title" or "media-0-uri").
+    """
+
+    def __init__(self, d: dict[Any, Any]) -> None:
+        self.keys = list(d.keys())
+        self.values = list(d.values())
+        self.parts: dict[str, tuple[int, int]] = {}
+        self.suffixes: dict[str, tuple[int, int]] = {}
+        self.cache: dict[str, str] = {}
+
+        for position, key in enumerate(self.keys):
+            parts = key.split("-")
+            depth = len(parts) - 1
+            for i, part in enumerate(parts):
+                for index, name in ((self.parts, part), (self.suffixes, "-".join(parts[i:]))):
+                    best = index.get(name)
+                    if best is None or depth < best[0]:
+                        index[name] = (depth, position)
+
+    @classmethod
+    def from_nested(cls, inp: dict[Any, Any] | list[Any]) -> "DenestedIndex":
+        return cls(dict_denester(inp))
+
+    def find(self, key_to_match: str) -> str:
+        """
+        Returns the value of the least nested key that contains key_to_match, see find_items
+        """
+        try:
+            return self.cache[key_to_match]
+        except KeyError:
+            pass
+
+        if "-" in key_to_match:
+            out = _find_items_scan(zip(self.keys, self.values), key_to_match)
+        else:
+            # a match that does not contain "-" falls within a single key part
+            matches = [best for part, best in self.parts.items() if key_to_match in part]
+            out = str(self.values[min(matches)[1]]) if matches else ""
+
+        self.cache[key_to_match] = out
+        return out
+
+    def find_suffix(self, key_to_match: str) -> str:
+        """
+        Returns the value of the least nested key that ends in key_to_match as whole key parts
+        """
+        best = self.suffixes.get(key_to_match)
+        return str(self.values[best[1]]) if best is not None else ""
+
+
+def _find_items_scan(items, key_to_match: str) -> str:
+    out = ""
+    pattern = re.compile(f"^.*{re.escape(key_to_match)}.*$", flags=re.DOTALL)
+    depth = math.inf
+
+    try:
+        for k, v in items:
+            if pattern.match(k):
+                depth_current_match = k.count("-")
+                if depth_current_match < depth:
+                    depth = depth_current_match
+                    out = str(v)
+    except Exception as e:
+        logger.error("bork bork: %s", e)
 
+    return out
 
 
-def find_items(d: dict[Any, Any],  key_to_match: str) -> str:
+def find_items(d: dict[Any, Any] | DenestedIndex,  key_to_match: str) -> str:
     """
-    d is a denested dict
+    d is a denested dict (or a DenestedIndex for repeated lookups, with the same result)
     match all keys in d that contain key_to_match
 
     return the value beloning to that key that is the least nested
@@ -210,43 +448,53 @@ def find_items(d: dict[Any, Any],  key_to_match: str) -> str:
 
     This function is needed because your_posts_1.json contains a wide variety of nestedness per post
     """
-    out = ""
-    pattern = r"{}".format(f"^.*{key_to_match}.*$")
-    depth = math.inf
+    if isinstance(d, DenestedIndex):
+        return d.find(key_to_match)
 
-    try:
-        for k, v in d.items():
-            if re.match(pattern, k):
-                depth_current_match = k.count("-")
-                if depth_current_match < depth:
-                    depth = depth_current_match
-                    out = str(v)
-    except Exception as e:
-        logger.error("bork bork: %s", e)
-
-    return out
+    return _find_items_scan(d.items(), key_to_match)
 
 
 
 def sort_isotimestamp_empty_timestamp_last(timestamp_series: pd.Series) -> pd.Series:
     """
+    Sort key that orders timestamps newest first, empty or invalid timestamps last
+
+    Accepts ISO 8601 strings, strings in DISPLAY_DATETIME_FORMAT or a pre-parsed datetime64 column.
+    Parsing is done once for the whole column, pass a datetime64 column to sort repeatedly at no cost.
+
     Can be used as follows:
 
     df = df.sort_values(by="Date", key=sort_isotimestamp_empty_timestamp_last)
     """
+    if pd.api.types.is_datetime64_any_dtype(timestamp_series):
+        datetimes = timestamp_series
+    else:
+        datetimes = parse_sortable_timestamps(timestamp_series)
 
-    def convert_timestamp(timestamp):
-        out = np.inf
-        try:
-            if isinstance(timestamp, str) and len(timestamp) > 0:
-                dt = datetime.fromisoformat(timestamp)
-                out = -dt.timestamp()
-        except Exception as e:
-            logger.debug("Cannot convert timestamp: %s", e)
+    if datetimes.dt.tz is None:
+        datetimes = datetimes.dt.tz_localize("UTC")
 
-        return out
+    seconds = (datetimes - pd.Timestamp(0, tz="UTC")).dt.total_seconds()
+    return (-seconds).fillna(np.inf)
 
-    return timestamp_series.apply(convert_timestamp)
+
+def parse_sortable_timestamps(timestamp_series: pd.Series) -> pd.Series:
+    """
+    Parses ISO 8601 strings and strings in DISPLAY_DATETIME_FORMAT to datetime64 (UTC) in a vectorized manner
+    Empty and invalid timestamps become NaT
+    """
+    if pd.api.types.infer_dtype(timestamp_series, skipna=True) in ("string", "empty"):
+        strings = timestamp_series.fillna("")
+    else:
+        # mixed column, values that are not strings are treated as empty
+        strings = timestamp_series.where(timestamp_series.astype(str).eq(timestamp_series), "")
+    datetimes = pd.to_datetime(strings.where(strings.ne(""), None), utc=True, errors="coerce", format=ISO8601_FORMAT)
+
+    failed = datetimes.isna() & strings.ne("")
+    if failed.any():
+        datetimes[failed] = pd.to_datetime(strings[failed], utc=True, errors="coerce", format=DISPLAY_DATETIME_FORMAT)
+
+    return datetimes
 
 
 
@@ -261,6 +509,8 @@ def fix_latin1_string(input: str) -> str:
         str: The fixed string after encoding and decoding, or the original string if an exception occurs.
     """
     try:
+        if input.isascii():
+            return input
         fixed_string = input.encode("latin1").decode()
         return fixed_string
     except Exception:
@@ -301,4 +551,216 @@ def replace_months(input_string):
     return input_string
 
 
+# Month names of the supported languages mapped to the English abbreviations understood by strptime
+
+
+MONTH_NAMES = {
+    # nl
+    "januari": "jan", "februari": "feb", "maart": "mar", "mrt": "mar", "april": "apr", "mei": "may",
+    "juni": "jun", "juli": "jul", "augustus": "aug", "oktober": "oct", "okt": "oct",
+    # de
+    "januar": "jan", "februar": "feb", "märz": "mar", "mär": "mar", "mai": "may", "dezember": "dec",
+    "dez": "dec", "sept": "sep",
+    # en
+    "january": "jan", "february": "feb", "march": "mar", "june": "jun", "july": "jul", "august": "aug",
+    "september": "sep", "october": "oct", "november": "nov", "december": "dec",
+}
+
+# Offsets in minutes of timezone abbreviations found in DDPs
+TIMEZONE_OFFSETS = {
+    "UTC": 0, "GMT": 0, "Z": 0, "WET": 0, "WEST": 60, "BST": 60, "IST": 60,
+    "CET": 60, "CEST": 120, "MEZ": 60, "MESZ": 120, "EET": 120, "EEST": 180,
+    "EST": -300, "EDT": -240, "CST": -360, "CDT": -300, "MST": -420, "MDT": -360, "PST": -480, "PDT": -420,
+}
+
+RE_MONTH_NAMES = re.compile(
+    r"\b(" + "|".join(sorted(MONTH_NAMES, key=len, reverse=True)) + r")\b\.?",
+    flags=re.IGNORECASE,
+)
+RE_TIMEZONE = re.compile(r"\s+([A-Z]{1,5})$")
+RE_WHITESPACE = re.compile(r"[\s\u202f\xa0]+")
+
+# Languages that write numeric dates day first (12.03.2024 is 12 March)
+DAYFIRST_LANGUAGES = {Language.NL, Language.DE}
+
+# Formats found in DDPs after month names are normalized, the first format that fits a sample is used
+DATETIME_FORMATS = [
+    "%d %b %Y, %H:%M:%S",        # nl: 12 mrt 2024, 10:15:02
+    "%b %d, %Y, %I:%M:%S %p",    # en (us): Mar 12, 2024, 10:15:02 AM
+    "%d %b %Y, %I:%M:%S %p",     # en (uk): 12 Mar 2024, 10:15:02 AM
+    "%d. %b %Y, %H:%M:%S",       # de: 12. März 2024, 10:15:02
+    "%d.%m.%Y, %H:%M:%S",        # de: 12.03.2024, 10:15:02
+    "%Y-%m-%d, %H:%M:%S",        # DISPLAY_DATETIME_FORMAT
+]
+
+# Datetime representation shared by all outputs. Datetimes are shown in UTC
+DISPLAY_DATETIME_FORMAT = "%Y-%m-%d, %H:%M:%S"
+RE_DISPLAY_DATETIME = re.compile(r"\d{4}-\d{2}-\d{2}, \d{2}:\d{2}:\d{2}")
+
+
+def _normalize_month(match: re.Match) -> str:
+    return MONTH_NAMES.get(match.group(1).lower(), match.group(1))
+
+
+class DateNormalizer:
+    """
+    Converts free-form date strings (e.g. "12 mrt 2024, 10:15:02 CET") to UTC datetimes
+
+    The format is inferred once from a sample and reused for all conversions.
+    Every distinct string is parsed only once, results are memoized.
+    Strings that do not fit the inferred format fall back to dateutil,
+    which reads numeric dates day first for the languages in DAYFIRST_LANGUAGES.
+    """
+
+    def __init__(self, sample_size: int = 50, language: Language | None = None) -> None:
+        self.sample_size = sample_size
+        self.dayfirst = language in DAYFIRST_LANGUAGES
+        self.format: str | None = None
+        self.cache: dict[str, pd.Timestamp] = {}
+
+    @staticmethod
+    def _normalize_text(strings: pd.Series) -> tuple[pd.Series, pd.Series]:
+        """
+        Normalizes whitespace and month names, splits off timezone abbreviations
+        Returns the normalized strings and the UTC offsets in minutes
+        """
+        strings = strings.str.replace(RE_WHITESPACE, " ", regex=True).str.strip()
+        timezones = strings.str.extract(RE_TIMEZONE, expand=False)
+        known = timezones.isin(TIMEZONE_OFFSETS.keys())
+        offsets = timezones.map(TIMEZONE_OFFSETS).where(known, 0)
+        strings = strings.where(~known, strings.str.replace(RE_TIMEZONE, "", regex=True))
+        strings = strings.str.replace(RE_MONTH_NAMES, _normalize_month, regex=True)
+        return strings, offsets
+
+    def infer_format(self, normalized: pd.Series) -> str | None:
+        """
+        Infers the format of normalized strings from a sample
+        """
+        sample = normalized[normalized.ne("")].iloc[: self.sample_size]
+        best, best_score = None, 0.0
+        for fmt in DATETIME_FORMATS:
+            score = pd.to_datetime(sample, format=fmt, errors="coerce").notna().mean()
+            if score > best_score:
+                best, best_score = fmt, score
+            if score == 1.0:
+                break
+
+        logger.debug("Inferred datetime format: %s (%s)", best, best_score)
+        return best
+
+    def _parse(self, strings: pd.Series) -> pd.Series:
+        normalized, offsets = self._normalize_text(strings)
+        if self.format is None:
+            self.format = self.infer_format(normalized)
+
+        if self.format is not None:
+            parsed = pd.to_datetime(normalized, format=self.format, errors="coerce")
+        else:
+            parsed = pd.Series(pd.NaT, index=strings.index, dtype="datetime64[ns]")
+
+        # last resort for strings that do not fit the format
+        failed = parsed.isna() & normalized.ne("")
+        if failed.any():
+            fallback = normalized[failed].map(lambda string: _parse_with_dateutil(string, self.dayfirst))
+            parsed[failed] = pd.to_datetime(fallback, errors="coerce")
+
+        parsed = parsed - pd.to_timedelta(offsets.astype(float), unit="m")
+        return parsed.dt.tz_localize("UTC")
+
+    def to_datetime(self, strings: pd.Series) -> pd.Series:
+        """
+        Converts a column of date strings to datetime64 (UTC), strings that cannot be parsed become NaT
+        """
+        strings = strings.fillna("").astype(str)
+        new = pd.Series(pd.unique(strings[~strings.isin(self.cache.keys())]), dtype=object)
+        if len(new) > 0:
+            self.cache.update(zip(new, self._parse(new)))
+
+        return pd.to_datetime(strings.map(self.cache), utc=True)
+
+    def parse(self, string: str) -> pd.Timestamp:
+        """
+        Converts a single date string, uses the memoized result if the string was seen before
+        Can be used while parsing, the format is inferred from the first string
+        """
+        try:
+            return self.cache[string]
+        except KeyError:
+            out = self._parse_one(string)
+            self.cache[string] = out
+            return out
+
+    def _parse_one(self, string: str) -> pd.Timestamp:
+        normalized = RE_WHITESPACE.sub(" ", string).strip()
+        offset = 0
+        timezone_match = RE_TIMEZONE.search(normalized)
+        if timezone_match is not None and timezone_match.group(1) in TIMEZONE_OFFSETS:
+            offset = TIMEZONE_OFFSETS[timezone_match.group(1)]
+            normalized = normalized[: timezone_match.start()]
+        normalized = RE_MONTH_NAMES.sub(_normalize_month, normalized)
+
+        if normalized == "":
+            return pd.NaT
+
+        if self.format is None:
+            self.format = self.infer_format(pd.Series([normalized], dtype=object))
+
+        try:
+            parsed = datetime.strptime(normalized, self.format)  # type: ignore
+        except (ValueError, TypeError):
+            parsed = _parse_with_dateutil(normalized, self.dayfirst)
+            if parsed is pd.NaT:
+                return pd.NaT
+
+        return pd.Timestamp(parsed - timedelta(minutes=offset), tz="UTC")
+
+
+def _parse_with_dateutil(string: str, dayfirst: bool = False):
+    try:
+        return parse(string, dayfirst=dayfirst, ignoretz=True)
+    except Exception:
+        return pd.NaT
+
+
+def format_datetime_column(datetimes: pd.Series, fallback: pd.Series | None = None) -> pd.Series:
+    """
+    Formats datetimes in the representation shared by all outputs (DISPLAY_DATETIME_FORMAT)
+    Missing datetimes are replaced by the fallback values or an empty string
+    """
+    out = datetimes.dt.strftime(DISPLAY_DATETIME_FORMAT)
+    return out.where(datetimes.notna(), "" if fallback is None else fallback)
+
+
+def parse_display_datetime_column(strings: pd.Series) -> pd.Series:
+    """
+    Parses strings in DISPLAY_DATETIME_FORMAT to datetime64 (UTC), other strings become NaT
+    """
+    # after replacing ", " with " " the strings are ISO 8601, for which pandas has a fast path
+    valid = strings.str.fullmatch(RE_DISPLAY_DATETIME).fillna(False).astype(bool)
+    iso = strings.where(valid, None).str.replace(", ", " ", regex=False)
+    return pd.to_datetime(iso, utc=True, errors="coerce", format=ISO8601_FORMAT)
+
+
+def normalize_datetime_column(strings: pd.Series, normalizer: DateNormalizer | None = None) -> pd.Series:
+    """
+    Converts a column of date strings in any supported format to the shared representation
+    Strings that cannot be parsed are kept as is
+    """
+    normalizer = normalizer or DateNormalizer()
+    return format_datetime_column(normalizer.to_datetime(strings), fallback=strings)
+
+
+def assign_sessions(datetimes: pd.Series, gap: pd.Timedelta) -> pd.Series:
+    """
+    Groups timestamps into sessions: a new session starts when more than gap passed since the previous timestamp
+
+    Returns session ids (numbered chronologically from 1) aligned with datetimes, NA for missing timestamps.
+    Sorts once, O(n log n)
+    """
+    ordered = datetimes.dropna().sort_values(kind="stable")
+    starts = ordered.diff().gt(gap)
+    if len(starts) > 0:
+        starts.iloc[0] = True
 
+    sessions = starts.cumsum().astype("Int64")
+    return sessions.reindex(datetimes.index)
@@ -1,24 +1,100 @@
 from collections.abc import Generator
+import logging
+
 from port.script import process
-from port.api.commands import CommandSystemExit
+from port.api.commands import CommandSystemDonate, CommandSystemExit, CommandSystemFlush, to_json_bytes
+
+logger = logging.getLogger(__name__)
+
+# Commands that are resolved by the host without input, these are batched
+FIRE_AND_FORGET = (CommandSystemDonate,)
+
+
+class PayloadVoid:
+    """
+    Payload the script is resumed with after a batched command, like the PayloadVoid the host resolves with
+    """
+    __slots__ = ()
+    __type__ = "PayloadVoid"
+    value = None
+
+
+PAYLOAD_VOID = PayloadVoid()
 
 
 class ScriptWrapper(Generator):
-    def __init__(self, script):
+    """
+    Drives the script, every send is one cycle (round trip) between the worker and the host
+
+    Fire and forget commands (donations) are collected and sent in a single CommandBatch,
+    together with the first command that needs a response (a render) or the exit.
+    A CommandSystemFlush yielded by the script sends the collected commands right away,
+    for instance before a long running extraction.
+
+    With json_bytes, commands are returned as a UTF-8 JSON buffer (see to_json_bytes)
+    that py_worker.js parses with JSON.parse, otherwise as a dict that is converted with toJs.
+
+    If the script raises, the collected commands are sent followed by a CommandSystemExit,
+    so donations (e.g. the logs) yielded before the error are not lost.
+    Every command is serialized separately, a command that cannot be serialized does not discard the others.
+    """
+
+    def __init__(self, script, batching=True, json_bytes=True):
         self.script = script
+        self.batching = batching
+        self.json_bytes = json_bytes
+
+    def _serialize(self, command):
+        if self.json_bytes:
+            return to_json_bytes(command)
+        return command.toDict()
+
+    def _serialize_batch(self, batch):
+        serialized = []
+        for command in batch:
+            try:
+                serialized.append(self._serialize(command))
+            except Exception as e:
+                logger.error("Could not serialize %s: %s", type(command).__name__, type(e).__name__)
+                if not isinstance(command, FIRE_AND_FORGET):
+                    # the host waits for the response to this command, end the script instead
+                    serialized.append(self._serialize(CommandSystemExit(1, "Could not serialize a command")))
+
+        if len(serialized) == 1:
+            return serialized[0]
+        if self.json_bytes:
+            return b'{"__type__":"CommandBatch","commands":[' + b",".join(serialized) + b"]}"
+        return {"__type__": "CommandBatch", "commands": serialized}
 
     def send(self, data):
-        try:
-            command = self.script.send(data)
-        except StopIteration:
-            return CommandSystemExit(0, "End of script").toDict()
-        else:
-            return command.toDict()
+        batch = []
+        while True:
+            try:
+                command = self.script.send(data)
+            except StopIteration:
+                batch.append(CommandSystemExit(0, "End of script"))
+                break
+            except Exception as e:
+                logger.error("Script failed: %s", type(e).__name__)
+                batch.append(CommandSystemExit(1, f"Script failed: {type(e).__name__}"))
+                break
+
+            data = PAYLOAD_VOID
+            if isinstance(command, CommandSystemFlush):
+                if batch:
+                    break
+            elif self.batching and isinstance(command, FIRE_AND_FORGET):
+                batch.append(command)
+            else:
+                batch.append(command)
+                break
+
+        return self._serialize_batch(batch)
 
     def throw(self, type=None, value=None, traceback=None):
         raise StopIteration
 
 
-def start(sessionId):
+def start(sessionId, batching=True, json_bytes=True):
     script = process(sessionId)
-    return ScriptWrapper(script)
+    return ScriptWrapper(script, batching, json_bytes)
@@ -0,0 +1,177 @@
+"""
+Contains a memory budget to guard the extraction of large DDPs
+
+In the browser a DDP that does not fit in memory crashes the tab without a useful signal.
+The budget is used to decide up front for files that would be loaded whole (based on their uncompressed size)
+and during parsing of streamed files (based on the memory in use) whether extraction should degrade
+to streaming and sampling. Degradation is recorded so researchers know the data was truncated.
+"""
+from dataclasses import dataclass, field
+import logging
+import os
+import sys
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+MiB = 1024 * 1024
+
+
+def is_pyodide() -> bool:
+    """
+    Detects if the code runs in Pyodide (WebAssembly)
+    """
+    return sys.platform == "emscripten"
+
+
+def memory_in_use() -> int:
+    """
+    Returns the memory in use in bytes
+
+    Pyodide: the size of the WebAssembly heap, note: this heap can grow but never shrinks
+    CPython: the memory traced by tracemalloc if it is tracing, otherwise the resident set size of the process
+    """
+    if is_pyodide():
+        try:
+            import pyodide_js  # type: ignore
+
+            return int(pyodide_js._module.HEAP8.length)
+        except Exception as e:
+            logger.debug("Could not determine wasm heap size: %s", e)
+            return 0
+
+    if tracemalloc.is_tracing():
+        current, _ = tracemalloc.get_traced_memory()
+        return current
+
+    return resident_memory()
+
+
+def resident_memory() -> int:
+    """
+    Returns the resident set size of the process in bytes, without the overhead of tracing allocations
+    Linux: the current size, other platforms: the peak size (getrusage), 0 if it cannot be determined
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS reports bytes, Linux kilobytes
+        return peak if sys.platform == "darwin" else peak * 1024
+    except Exception as e:
+        logger.debug("Could not determine resident memory: %s", e)
+        return 0
+
+
+@dataclass
+class MemoryBudget:
+    """
+    Memory budget for the extraction of a DDP
+
+    Attributes:
+        limit: the memory budget in bytes
+        max_rows: the maximum number of rows kept after the budget is exceeded
+        expansion_factor: estimate of the memory needed per byte of uncompressed input
+        check_every: number of parsed items after which memory in use is checked
+        trace: CPython only, measure the memory in use with tracemalloc (precise, but slows down every allocation)
+            instead of the resident set size of the process
+        degraded: True if the extraction was truncated or sampled
+        reasons: human readable reasons for degradation
+    """
+
+    limit: int = 512 * MiB
+    max_rows: int = 100_000
+    expansion_factor: float = 4.0
+    check_every: int = 1000
+    trace: bool = False
+    degraded: bool = False
+    reasons: list[str] = field(default_factory=list)
+
+    _started_tracing: bool = field(default=False, init=False, repr=False)
+    _baseline: int = field(default=0, init=False, repr=False)
+
+    def fits(self, uncompressed_size: int) -> bool:
+        """
+        Estimates up front if a file of uncompressed_size can be processed fully in memory
+        """
+        estimate = int(uncompressed_size * self.expansion_factor)
+        fits = estimate <= self.limit
+        logger.debug("Estimated memory: %s bytes, budget: %s bytes, fits: %s", estimate, self.limit, fits)
+        return fits
+
+    def start(self) -> None:
+        """
+        Starts tracking memory, on CPython tracemalloc is only started if trace is set
+        """
+        if self.trace and not is_pyodide() and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._baseline = memory_in_use()
+
+    def stop(self) -> None:
+        """
+        Stops tracking allocations, only stops tracemalloc if it was started by this budget
+        """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def exceeded(self) -> bool:
+        """
+        Checks if the memory in use since start() exceeds the budget
+        """
+        return memory_in_use() - self._baseline > self.limit
+
+    def degrade(self, reason: str) -> None:
+        """
+        Records that the extraction degraded
+        """
+        logger.warning("Extraction degraded: %s", reason)
+        self.degraded = True
+        self.reasons.append(reason)
+
+
+class RowThinner:
+    """
+    Keeps at most max_rows rows out of a stream of rows of unknown length
+
+    While the number of kept rows is below max_rows every row is kept.
+    When max_rows is reached every other row is dropped and the stride is doubled,
+    so the kept rows are a systematic sample spread over the whole stream.
+    Memory use is O(max_rows).
+    """
+
+    def __init__(self, max_rows: int | None = None) -> None:
+        self.max_rows = max_rows
+        self.rows: list = []
+        self.stride = 1
+        self.n_seen = 0
+
+    def cap(self, max_rows: int) -> None:
+        """
+        Starts capping at max_rows, rows that are already kept are thinned if needed
+        """
+        self.max_rows = max(max_rows, 2)
+        while len(self.rows) >= self.max_rows:
+            self._thin()
+
+    def add(self, row) -> None:
+        if self.n_seen % self.stride == 0:
+            self.rows.append(row)
+            if self.max_rows is not None and len(self.rows) >= self.max_rows:
+                self._thin()
+        self.n_seen += 1
+
+    @property
+    def thinned(self) -> bool:
+        return self.stride > 1
+
+    def _thin(self) -> None:
+        self.rows = self.rows[::2]
+        self.stride *= 2
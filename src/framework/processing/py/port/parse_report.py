@@ -0,0 +1,99 @@
+"""
+Contains the parse report to account for items (cards, JSON items) that could not be parsed
+
+In robust mode a failing item is quarantined: it is counted per failure category
+and parsing continues with the next item. Parsing only stops when the error budget is exceeded.
+The report can be donated, so researchers know what was left out and why.
+Only counts are kept, items are never stored: the report is donated before the participant consents.
+"""
+from dataclasses import dataclass, field
+from enum import Enum
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FailureCategory(Enum):
+    """ Reasons an item could not be parsed """
+    EXCEPTION = "exception"
+    MISSING_DATE = "missing_date"
+    MISSING_COMMAND = "missing_command"
+    MALFORMED_ITEM = "malformed_item"
+    READ_ERROR = "read_error"
+
+
+@dataclass
+class ParseReport:
+    """
+    Success and failure counts of a parse
+
+    Attributes:
+        error_budget: fraction of failing items that is tolerated
+        min_items: the error budget is only checked after min_items items, a few early failures do not stop parsing
+        chunk_size: the error budget is checked after every chunk of chunk_size items
+        source: the file that is currently parsed
+        n_parsed: number of items that were parsed successfully
+        n_failed: number of items that were quarantined
+        failures: number of failures per category
+        aborted: True if parsing stopped because the error budget was exceeded
+        next_check: number of items at which the error budget is checked next
+    """
+    error_budget: float = 0.1
+    min_items: int = 100
+    chunk_size: int = 1000
+
+    source: str = ""
+    n_parsed: int = 0
+    n_failed: int = 0
+    failures: dict[str, int] = field(default_factory=dict)
+    aborted: bool = False
+    next_check: int = 0
+
+    def success(self, n: int = 1) -> None:
+        self.n_parsed += n
+
+    def failure(self, category: FailureCategory, message: str) -> None:
+        """
+        Quarantines an item
+        message: describes the failure, it ends up in the donated logs so it should not contain the item
+        """
+        self.n_failed += 1
+        self.failures[category.value] = self.failures.get(category.value, 0) + 1
+        logger.debug("Quarantined item (%s): %s", category.value, message)
+
+    def exceeded(self) -> bool:
+        """
+        Checks if the fraction of failing items exceeds the error budget
+        """
+        n_items = self.n_parsed + self.n_failed
+        return n_items >= self.min_items and self.n_failed > self.error_budget * n_items
+
+    def check(self) -> bool:
+        """
+        Called after every item, the error budget is checked once every chunk of items
+        Returns False if parsing should stop
+        """
+        n_items = self.n_parsed + self.n_failed
+        if n_items < self.next_check:
+            return True
+
+        self.next_check = n_items + self.chunk_size
+        if self.exceeded():
+            self.abort()
+            return False
+        return True
+
+    def abort(self) -> None:
+        logger.error(
+            "Error budget exceeded: %s out of %s items failed, stopped parsing %s",
+            self.n_failed, self.n_parsed + self.n_failed, self.source,
+        )
+        self.aborted = True
+
+    def to_dict(self) -> dict:
+        return {
+            "status": "ABORTED" if self.aborted else "PARSED",
+            "parsed": self.n_parsed,
+            "failed": self.n_failed,
+            "failures": self.failures,
+        }
@@ -0,0 +1,122 @@
+"""
+Contains samplers to keep oversized histories manageable
+
+Rows are sampled while they are parsed, memory use is proportional to the sample size.
+Exact counts per month are kept for all rows, so they can be reported as aggregates.
+"""
+from dataclasses import dataclass
+from enum import Enum
+import logging
+import random
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingMode(Enum):
+    """ Sampling modes Enum """
+    RESERVOIR = 1
+    MONTH = 2
+
+
+@dataclass
+class SamplingConfig:
+    """
+    Sampling configuration of a study
+
+    Attributes:
+        mode: None (no sampling), RESERVOIR (uniform sample of size rows)
+            or MONTH (uniform sample of size rows per month)
+        size: sample size, per month in case of MONTH
+        seed: seed of the random number generator, sampling is reproducible
+    """
+    mode: SamplingMode | None = None
+    size: int = 10_000
+    seed: int = 0
+
+
+class ReservoirSampler:
+    """
+    Uniform random sample of at most size rows out of a stream of unknown length (algorithm R)
+    """
+
+    def __init__(self, size: int, rng: random.Random) -> None:
+        self.size = size
+        self.rng = rng
+        self.n_seen = 0
+        self.reservoir: list[tuple[int, object]] = []
+
+    def add(self, position: int, row: object) -> None:
+        if self.n_seen < self.size:
+            self.reservoir.append((position, row))
+        else:
+            j = self.rng.randrange(self.n_seen + 1)
+            if j < self.size:
+                self.reservoir[j] = (position, row)
+        self.n_seen += 1
+
+
+class Sampler:
+    """
+    Samples rows while they are parsed and counts all rows per month
+
+    In RESERVOIR mode a single reservoir is used, in MONTH mode one reservoir per month (stratified sample).
+    rows() returns the sampled rows in their original order.
+    """
+
+    def __init__(self, config: SamplingConfig) -> None:
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.reservoirs: dict[str, ReservoirSampler] = {}
+        self.month_counts: dict[str, int] = {}
+        self.n_seen = 0
+
+    def add(self, row: object, month: str) -> None:
+        """
+        month: the month of the row formatted as YYYY-MM, empty if unknown
+        """
+        self.month_counts[month] = self.month_counts.get(month, 0) + 1
+
+        key = month if self.config.mode == SamplingMode.MONTH else ""
+        reservoir = self.reservoirs.get(key)
+        if reservoir is None:
+            reservoir = self.reservoirs[key] = ReservoirSampler(self.config.size, self.rng)
+
+        reservoir.add(self.n_seen, row)
+        self.n_seen += 1
+
+    def rows(self) -> list:
+        kept = sorted(item for reservoir in self.reservoirs.values() for item in reservoir.reservoir)
+        return [row for _, row in kept]
+
+    @property
+    def n_kept(self) -> int:
+        return sum(len(reservoir.reservoir) for reservoir in self.reservoirs.values())
+
+    @property
+    def sampled(self) -> bool:
+        return self.n_kept < self.n_seen
+
+    def month_counts_to_df(self) -> pd.DataFrame:
+        """
+        Exact number of rows per month and the number of rows in the sample, newest month first
+        """
+        kept: dict[str, int] = {}
+        if self.config.mode == SamplingMode.MONTH:
+            kept = {month: len(reservoir.reservoir) for month, reservoir in self.reservoirs.items()}
+
+        out = pd.DataFrame({
+            "Maand": list(self.month_counts.keys()),
+            "Aantal interacties": list(self.month_counts.values()),
+        })
+        if kept:
+            out["Aantal in steekproef"] = out["Maand"].map(kept)
+
+        return out.sort_values("Maand", ascending=False).reset_index(drop=True)
+
+
+def create_sampler(config: SamplingConfig | None) -> Sampler | None:
+    if config is None or config.mode is None:
+        return None
+    return Sampler(config)
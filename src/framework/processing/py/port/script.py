@@ -1,3 +1,4 @@
+import functools
 import logging
 import json
 import io
@@ -7,8 +8,14 @@ import pandas as pd
 import port.api.props as props
 import port.validate as validate
 import port.google_home as google_home
+import port.extraction_plan as extraction_plan
+import port.helpers as helpers
+import port.memory as memory
+import port.parse_report as parse_report
+import port.sampling as sampling
+import port.scrub as scrub
 
-from port.api.commands import (CommandSystemDonate, CommandUIRender, CommandSystemExit)
+from port.api.commands import (CommandSystemDonate, CommandUIRender, CommandSystemExit, CommandSystemFlush)
 
 LOG_STREAM = io.StringIO()
 
@@ -21,6 +28,32 @@ logging.basicConfig(
 
 LOGGER = logging.getLogger("script")
 
+# Memory budget for the extraction
+# When a DDP does not fit, extraction switches to streaming and the rows are sampled
+MEMORY_BUDGET = 512 * memory.MiB
+MEMORY_BUDGET_MAX_ROWS = 100_000
+
+# Only interactions within the study window are extracted, None means no limit
+# example: google_home.StudyWindow(start="2023-01-01", end="2024-06-01", max_rows=50_000)
+STUDY_WINDOW = google_home.StudyWindow(start=None, end=None, max_rows=None)
+
+# Oversized histories can be sampled while parsing, mode None means no sampling
+# example: sampling.SamplingConfig(mode=sampling.SamplingMode.MONTH, size=500, seed=42)
+SAMPLING = sampling.SamplingConfig(mode=None)
+
+# Personal information in the commands and responses is redacted before it is shown, None means no scrubbing
+# example: scrub.ScrubConfig(patterns=("email", "phone"), terms=("Jan", "Janssen"))
+SCRUBBING: scrub.ScrubConfig | None = None
+
+# Items that cannot be parsed are quarantined, parsing stops when more than PARSE_ERROR_BUDGET of the items fail
+PARSE_ERROR_BUDGET = 0.1
+
+# Tables that serialize to more than TABLE_MAX_BYTES are shown as multiple consent tables
+TABLE_MAX_BYTES = 20 * memory.MiB
+
+# Interactions less than SESSION_GAP apart are grouped into a single conversation
+SESSION_GAP = pd.Timedelta(minutes=5)
+
 
 def process(session_id):
     LOGGER.info("Starting the donation flow")
@@ -37,6 +70,8 @@ def process(session_id):
         platform_name, extraction_fun, validation_fun = platform
 
         table_list = None
+        budget = memory.MemoryBudget(limit=MEMORY_BUDGET, max_rows=MEMORY_BUDGET_MAX_ROWS)
+        report = parse_report.ParseReport(error_budget=PARSE_ERROR_BUDGET)
 
         # Prompt file extraction loop
         while True:
@@ -44,25 +79,37 @@ def process(session_id):
             yield donate_logs(f"{session_id}-tracking")
 
             # Render the propmt file page
-            promptFile = prompt_file("application/zip, text/plain, application/json")
-            file_result = yield render_donation_page(platform_name, promptFile)
+            file_result = yield render_file_prompt_page(platform_name, "application/zip, text/plain, application/json")
 
             if file_result.__type__ == "PayloadString":
                 validation = validation_fun(file_result.value)
 
-                # DDP is recognized: Status code zero
-                if validation.status_code.id == 0: 
+                # DDP is recognized: Status code zero, or three if a truncated zipfile was recovered
+                if validation.status_code.id in google_home.VALID_STATUS_CODES:
                     LOGGER.info("Payload for %s", platform_name)
                     yield donate_logs(f"{session_id}-tracking")
 
-                    table_list = extraction_fun(file_result.value, validation)
+                    if validation.status_code.id == 3:
+                        yield donate_status(f"{session_id}-RECOVERED", "RECOVERED")
+
+                    # Send the donations before extracting, so they arrive even if the extraction crashes the tab
+                    yield flush()
+                    table_list = extraction_fun(file_result.value, validation, budget, report)
+
+                    if budget.degraded:
+                        LOGGER.info("Extraction degraded for %s", platform_name)
+                        yield donate_degraded(f"{session_id}-DEGRADED", budget)
+
+                    if report.n_failed > 0:
+                        LOGGER.info("Quarantined %s items for %s", report.n_failed, platform_name)
+                        yield donate_parse_report(f"{session_id}-PARSE-REPORT", report)
                     break
 
                 # DDP is not recognized: Different status code
-                if validation.status_code.id != 0: 
+                if validation.status_code.id not in google_home.VALID_STATUS_CODES:
                     LOGGER.info("Not a valid %s zip; No payload; prompt retry_confirmation", platform_name)
                     yield donate_logs(f"{session_id}-tracking")
-                    retry_result = yield render_donation_page(platform_name, retry_confirmation(platform_name))
+                    retry_result = yield render_retry_page(platform_name)
 
                     if retry_result.__type__ == "PayloadTrue":
                         continue
@@ -166,6 +213,14 @@ def donate_status(filename: str, message: str):
     return donate(filename, json.dumps({"status": message}))
 
 
+def donate_degraded(filename: str, budget: memory.MemoryBudget):
+    return donate(filename, json.dumps({"status": "DEGRADED", "reasons": budget.reasons}))
+
+
+def donate_parse_report(filename: str, report: parse_report.ParseReport):
+    return donate(filename, json.dumps(report.to_dict()))
+
+
 def create_empty_table(platform_name: str) -> props.PropsUIPromptConsentFormTable:
     """
     Show something in case no data was extracted
@@ -182,13 +237,30 @@ def create_empty_table(platform_name: str) -> props.PropsUIPromptConsentFormTabl
 ##################################################################
 # Extraction functions
 
-def extract_google_home(zipfile: str, validation: validate.ValidateInput) -> list[props.PropsUIPromptConsentFormTable]:
+def extract_google_home(
+    zipfile: str,
+    validation: validate.ValidateInput,
+    budget: memory.MemoryBudget | None = None,
+    report: parse_report.ParseReport | None = None,
+) -> list[props.PropsUIPromptConsentFormTable]:
     """
     Main data extraction function. Assemble all extraction logic here.
     """
     tables_to_render = []
 
-    df = google_home.google_home_to_df(zipfile, validation)
+    sampler = sampling.create_sampler(SAMPLING)
+
+    # Every file the tables need is requested from one plan, the zip is read in a single pass
+    plan = extraction_plan.ExtractionPlan()
+    activity = google_home.plan_activity(plan, validation, budget, STUDY_WINDOW, sampler, report)
+    plan.run(zipfile, budget)
+
+    df = google_home.planned_activity_to_df(activity, report)
+
+    scrub_report = None
+    if SCRUBBING is not None and not df.empty:
+        df, scrub_report = scrub.Scrubber(SCRUBBING).scrub_df(df)
+
     if not df.empty:
 
         wordcloud = {
@@ -201,32 +273,125 @@ def extract_google_home(zipfile: str, validation: validate.ValidateInput) -> lis
             "en": "You can see at what day and time what command was understood by the assistant and what the device might have said or done in response. You have the option to select specific rows in the table and remove them if you do not want to share them with us. Below the table you see a word cloud of the most frequent words in your commands. The bigger the word the more often it was used. You can click on the magnifying glass to make the word cloud bigger.", 
             "nl": "U kunt zien op welke dag en tijd welk commando werd begrepen door de assistent en wat het apparaat mogelijk heeft gezegd of gedaan als reactie. U hebt de optie om specifieke rijen in de tabel te selecteren en te verwijderen als u ze niet met ons wilt delen. Onder de tabel ziet u een woordwolk van de meest voorkomende woorden in uw commando's. Hoe groter het woord, hoe vaker het werd gebruikt. U kunt op het vergrootglas klikken om de woordenwolk groter te maken.", 
         })
-        table =  props.PropsUIPromptConsentFormTable("google_home_data", table_title, df, table_description, [wordcloud])
-        tables_to_render.append(table)
+        # The parts are views on df, the table is not copied to split it
+        parts = list(helpers.iter_dataframe_chunks(df, max_bytes=TABLE_MAX_BYTES))
+        for i, part in enumerate(parts, start=1):
+            table_id, part_title = "google_home_data", table_title
+            if len(parts) > 1:
+                table_id = f"google_home_data_{i}"
+                part_title = props.Translatable({
+                    "en": f"Your Google Assistant Data (part {i} of {len(parts)})",
+                    "nl": f"Uw Google Assistent gegevens (deel {i} van {len(parts)})",
+                })
+            table = props.PropsUIPromptConsentFormTable(table_id, part_title, part, table_description, [wordcloud])
+            tables_to_render.append(table)
+
+        # Conversations can not be reconstructed from a sample
+        sampled = sampler is not None and sampler.sampled
+        sessions_df = pd.DataFrame() if sampled else google_home.google_home_sessions_to_df(df, SESSION_GAP)
+        if not sessions_df.empty:
+            table_title = props.Translatable({
+                "en": "Your conversations with Google Assistant",
+                "nl": "Uw gesprekken met Google Assistent",
+            })
+            table_description = props.Translatable({
+                "en": (
+                    "Commands given shortly after each other are grouped into a conversation. "
+                    "For every conversation you can see when it started, how long it lasted, "
+                    "how many commands were given and what the first command was."
+                ),
+                "nl": (
+                    "Commando's die kort na elkaar zijn gegeven, zijn gegroepeerd in een gesprek. "
+                    "Per gesprek ziet u wanneer het begon, hoe lang het duurde, "
+                    "hoeveel commando's er werden gegeven en wat het eerste commando was."
+                ),
+            })
+            table = props.PropsUIPromptConsentFormTable(
+                "google_home_sessions", table_title, sessions_df, table_description
+            )
+            tables_to_render.append(table)
+
+        if sampled:
+            table_title = props.Translatable({
+                "en": "Number of interactions per month",
+                "nl": "Aantal interacties per maand",
+            })
+            table_description = props.Translatable({
+                "en": (
+                    "Your history is too long to show completely, "
+                    "the table above shows a random sample of your interactions. "
+                    "This table shows the number of interactions per month in your full history."
+                ),
+                "nl": (
+                    "Uw geschiedenis is te lang om volledig te tonen, "
+                    "de tabel hierboven toont een willekeurige steekproef van uw interacties. "
+                    "Deze tabel toont het aantal interacties per maand in uw volledige geschiedenis."
+                ),
+            })
+            table = props.PropsUIPromptConsentFormTable(
+                "google_home_months", table_title, sampler.month_counts_to_df(), table_description
+            )
+            tables_to_render.append(table)
+
+        if scrub_report is not None and scrub_report.total:
+            table_title = props.Translatable({
+                "en": "Removed personal information",
+                "nl": "Verwijderde persoonlijke gegevens",
+            })
+            table_description = props.Translatable({
+                "en": (
+                    "Personal information such as email addresses, phone numbers and names "
+                    "was automatically replaced in the table above. "
+                    "This table shows how many items of each kind were replaced."
+                ),
+                "nl": (
+                    "Persoonlijke gegevens zoals e-mailadressen, telefoonnummers en namen "
+                    "zijn automatisch vervangen in de tabel hierboven. "
+                    "Deze tabel toont hoeveel gegevens van elke soort zijn vervangen."
+                ),
+            })
+            table = props.PropsUIPromptConsentFormTable(
+                "google_home_redactions", table_title, scrub_report.to_df(), table_description
+            )
+            tables_to_render.append(table)
 
     return tables_to_render
 
 
-
 ##########################################
 # Functions provided by Eyra did not change
 
+# Static pages are built once per session, the props are immutable and serialized once (see props._cached)
+@functools.cache
 def render_end_page():
     page = props.PropsUIPageEnd()
     return CommandUIRender(page)
 
 
+DONATION_PAGE_HEADER = props.PropsUIHeader(
+    props.Translatable(
+        {"en": "Sharing your Google Assistant data",
+         "nl": "Uw Google Assistent gegevens delen"}
+    ))
+DONATION_PAGE_FOOTER = props.PropsUIFooter()
+
+
 def render_donation_page(platform, body):
-    header = props.PropsUIHeader(
-        props.Translatable(
-            {"en": "Sharing your Google Assistant data", 
-             "nl": "Uw Google Assistent gegevens delen"}
-        ))
-    footer = props.PropsUIFooter()
-    page = props.PropsUIPageDonation(platform, header, body, footer)
+    page = props.PropsUIPageDonation(platform, DONATION_PAGE_HEADER, body, DONATION_PAGE_FOOTER)
     return CommandUIRender(page)
 
 
+@functools.cache
+def render_file_prompt_page(platform, extensions):
+    return render_donation_page(platform, prompt_file(extensions))
+
+
+@functools.cache
+def render_retry_page(platform):
+    return render_donation_page(platform, retry_confirmation(platform))
+
+
+@functools.cache
 def retry_confirmation(platform):
     text = props.Translatable(
         {
@@ -239,6 +404,7 @@ def retry_confirmation(platform):
     return props.PropsUIPromptConfirm(text, ok, cancel)
 
 
+@functools.cache
 def prompt_file(extensions):
     description = props.Translatable(
         {
@@ -253,6 +419,10 @@ def donate(key, json_string):
     return CommandSystemDonate(key, json_string)
 
 
+def flush():
+    return CommandSystemFlush()
+
+
 def exit(code, info):
     return CommandSystemExit(code, info)
 
@@ -268,6 +438,7 @@ NO_DONATION_REASONS = props.Translatable({
 })
 
 
+@functools.cache
 def render_questionnaire():
     platform_name = "Google"
 
@@ -329,8 +500,7 @@ def render_questionnaire():
     return CommandUIRender(page)
 
 
-
-
+@functools.cache
 def render_questionnaire_no_donation():
     platform_name = "Google"
 
@@ -0,0 +1,189 @@
+"""
+Contains the scrubbing stage that redacts personal information from free text columns
+
+Structured personal information (emails, phone numbers, ...) is found with precompiled regexes,
+names and other study specific terms with a single regex compiled from a trie of the terms.
+All patterns are combined into one regex, so every text is scanned once.
+Texts repeat a lot, so every unique text is scrubbed only once and the result is mapped back.
+"""
+from dataclasses import dataclass, field
+import logging
+import re
+
+import pandas as pd
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TERM = "term"
+
+# Order matters: the first pattern that matches at a position wins
+PII_PATTERNS: dict[str, str] = {
+    "email": r"[\w.+-]+@[\w-]+(?:\.[\w-]+)*\.[A-Za-z]{2,}",
+    "url": r"(?:https?://|www\.)[^\s<>\"']+",
+    "iban": r"\b[A-Z]{2}\d{2}(?:\s?[A-Z0-9]{4}){2,7}(?:\s?[A-Z0-9]{1,3})?\b",
+    "phone": r"(?<![\w+])(?:(?:\+|00)\d{2,3}|0)[\s-]?[1-9](?:[\s-]?\d){7,9}(?!\w)",
+    "postcode": r"\b[1-9]\d{3}\s?(?!SA|SD|SS)[A-Z]{2}\b",
+}
+
+
+@dataclass
+class ScrubConfig:
+    """
+    Scrubbing configuration of a study
+
+    Attributes:
+        patterns: names of the PII_PATTERNS to redact
+        terms: names or other words to redact, matched case insensitive on word boundaries
+        columns: the columns to scrub
+        replacement: the replacement text, {name} is replaced with the name of the pattern
+    """
+    patterns: tuple[str, ...] = tuple(PII_PATTERNS)
+    terms: tuple[str, ...] = ()
+    columns: tuple[str, ...] = ("Uw commando", "Reactie van de assistent")
+    replacement: str = "[{name}]"
+
+
+@dataclass
+class ScrubReport:
+    """
+    Number of redactions per pattern and the number of texts (cells) that changed
+    """
+    redactions: dict[str, int] = field(default_factory=dict)
+    texts_changed: int = 0
+
+    @property
+    def total(self) -> int:
+        return sum(self.redactions.values())
+
+    def to_df(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "Soort gegevens": list(self.redactions.keys()),
+            "Aantal verwijderd": list(self.redactions.values()),
+        })
+
+
+def terms_to_regex(terms: tuple[str, ...] | list[str]) -> str:
+    """
+    Compiles a list of terms into a single regex via a trie of the lowercased terms
+
+    The alternatives share their prefixes, so the regex engine never compares
+    a position against every term (like the Aho-Corasick algorithm).
+    """
+    trie: dict = {}
+    for term in terms:
+        term = term.strip().lower()
+        if not term:
+            continue
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def to_regex(node: dict) -> str:
+        end = "" in node
+        alternatives = [re.escape(char) + to_regex(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+        if len(alternatives) == 1 and not end:
+            return alternatives[0]
+        out = "(?:" + "|".join(alternatives) + ")"
+        return out + "?" if end else out
+
+    return to_regex(trie)
+
+
+class Scrubber:
+    """
+    Redacts personal information according to a ScrubConfig
+    """
+
+    def __init__(self, config: ScrubConfig) -> None:
+        self.config = config
+
+        groups = []
+        for name in config.patterns:
+            if name not in PII_PATTERNS:
+                logger.error("Unknown PII pattern: %s", name)
+                continue
+            groups.append(f"(?P<{name}>{PII_PATTERNS[name]})")
+
+        terms = terms_to_regex(config.terms)
+        if terms:
+            groups.append(f"(?P<{TERM}>(?i:(?<!\\w){terms}(?!\\w)))")
+
+        self.regex = re.compile("|".join(groups)) if groups else None
+        self.replacements = {
+            name: config.replacement.format(name=name.upper())
+            for name in [*PII_PATTERNS, TERM]
+        }
+
+    def scrub(self, text: str) -> tuple[str, dict[str, int]]:
+        """
+        Scrubs a single text, returns the scrubbed text and the number of redactions per pattern
+        """
+        counts: dict[str, int] = {}
+        if self.regex is None:
+            return text, counts
+
+        def replace(match: re.Match) -> str:
+            name = match.lastgroup
+            counts[name] = counts.get(name, 0) + 1
+            return self.replacements[name]
+
+        return self.regex.sub(replace, text), counts
+
+    def scrub_series(self, series: pd.Series, report: ScrubReport | None = None) -> pd.Series:
+        """
+        Scrubs every unique text of the series once, counts are added to report for every occurrence
+        """
+        if self.regex is None or series.empty:
+            return series
+
+        codes, uniques = pd.factorize(series)
+        weights = np.bincount(codes[codes >= 0], minlength=len(uniques))
+
+        scrubbed = []
+        changed = np.zeros(len(uniques), dtype=bool)
+        for i, text in enumerate(uniques):
+            if not isinstance(text, str):
+                scrubbed.append(text)
+                continue
+
+            out, counts = self.scrub(text)
+            scrubbed.append(out)
+            if counts:
+                changed[i] = True
+                if report is not None:
+                    for name, count in counts.items():
+                        report.redactions[name] = report.redactions.get(name, 0) + count * int(weights[i])
+
+        if not changed.any():
+            return series
+
+        if report is not None:
+            report.texts_changed += int(weights[changed].sum())
+
+        values = np.asarray(scrubbed, dtype=object).take(codes)
+        values[codes < 0] = None
+        out = pd.Series(values, index=series.index, name=series.name)
+
+        # Scrubbed texts can coincide, so the categories are rebuilt
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            out = out.astype("category")
+        return out
+
+    def scrub_df(self, df: pd.DataFrame) -> tuple[pd.DataFrame, ScrubReport]:
+        """
+        Scrubs the configured columns of df, returns the scrubbed copy and a report
+        """
+        report = ScrubReport()
+        out = df.copy(deep=False)
+        for column in self.config.columns:
+            if column in out.columns:
+                out[column] = self.scrub_series(out[column], report)
+
+        if report.total:
+            logger.info("Redacted %s items in %s texts: %s", report.total, report.texts_changed, report.redactions)
+
+        return out, report
@@ -3,35 +3,200 @@ Contains functions to deal with zipfiles
 """
 
 from pathlib import Path
-from typing import Any, Callable
+from typing import Any, IO, Iterator
+from contextlib import contextmanager
 import logging
 import zipfile
+import codecs
 import json
+import zlib
 import csv
 import io
+import os
+
+try:
+    import mmap
+except ImportError:
+    mmap = None  # type: ignore
 
 import pandas as pd
 
 from port.my_exceptions import FileNotFoundInZipError
+import port.memory as memory
+import port.ziprecover as ziprecover
 
 logger = logging.getLogger(__name__)
 
+# Zipfiles are memory mapped when mmap is available, in Pyodide the file system lives in memory already
+USE_MMAP = mmap is not None and not memory.is_pyodide()
+
+MMAP_READ_SIZE = 1024 * 1024
+
+
+class MappedMemberReader(io.RawIOBase):
+    """
+    Reads a member of a memory mapped zipfile
+    Stored members are copied straight from the map, deflated members are inflated chunk by chunk
+    """
+
+    def __init__(self, view: memoryview, info: zipfile.ZipInfo) -> None:
+        self.view = view
+        self.info = info
+        self.position = 0
+        self.inflater = zlib.decompressobj(-zlib.MAX_WBITS) if info.compress_type == zipfile.ZIP_DEFLATED else None
+        self.pending = b""
+        self.finished = False
+        self.crc = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill(self, size: int) -> None:
+        while not self.pending and not self.finished:
+            data = self.inflater.unconsumed_tail
+            if not data:
+                data = self.view[self.position:self.position + MMAP_READ_SIZE]
+                self.position += len(data)
+            if not data:
+                self.pending = self.inflater.flush()
+                self.finished = True
+                continue
+
+            self.pending = self.inflater.decompress(data, size)
+            self.finished = self.inflater.eof
+
+    def readinto(self, b) -> int:
+        if self.inflater is None:
+            n = min(len(b), len(self.view) - self.position)
+            b[:n] = self.view[self.position:self.position + n]
+            self.position += n
+        else:
+            self._fill(len(b))
+            n = min(len(b), len(self.pending))
+            b[:n] = self.pending[:n]
+            self.pending = self.pending[n:]
+
+        self.crc = zlib.crc32(memoryview(b)[:n], self.crc)
+        if n == 0 and len(b) > 0 and self.crc != self.info.CRC:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {self.info.filename!r}")
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self.view.release()
+        super().close()
+
+
+class MmapArchive(zipfile.ZipFile):
+    """
+    Zipfile backed by a memory map of the file (CPython)
+
+    The central directory is read by zipfile, the members are read straight from the map:
+    stored members can be sliced without copying (view), deflated members are inflated from the map.
+    Encrypted members and other compression methods are left to zipfile.
+    """
+
+    def __init__(self, zfile: str | os.PathLike) -> None:
+        self._map = None
+        self._file = open(zfile, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            # an empty file cannot be mapped
+            self._file.close()
+            raise zipfile.BadZipFile(f"Could not map {zfile}: {e}")
+
+        try:
+            super().__init__(self._map, "r")
+        except BaseException:
+            self._map.close()
+            self._file.close()
+            raise
+        self.filename = str(zfile)
+
+    def _mapped(self, info: zipfile.ZipInfo) -> bool:
+        encrypted = info.flag_bits & ziprecover.FLAG_ENCRYPTED
+        return not encrypted and info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+
+    def _data(self, info: zipfile.ZipInfo) -> memoryview:
+        header = self._map[info.header_offset:info.header_offset + ziprecover.LOCAL_HEADER.size]
+        if len(header) < ziprecover.LOCAL_HEADER.size:
+            raise zipfile.BadZipFile("Truncated file header")
+        signature, *_, name_length, extra_length = ziprecover.LOCAL_HEADER.unpack(header)
+        if signature != ziprecover.LOCAL_SIGNATURE:
+            raise zipfile.BadZipFile("Bad magic number for file header")
+
+        start = info.header_offset + ziprecover.LOCAL_HEADER.size + name_length + extra_length
+        return memoryview(self._map)[start:start + info.compress_size]
+
+    def view(self, name: str | zipfile.ZipInfo) -> memoryview:
+        """
+        Returns the data of a stored (uncompressed) member without copying it
+        The view has to be released before the archive is closed
+        """
+        info = name if isinstance(name, zipfile.ZipInfo) else self.getinfo(name)
+        if info.compress_type != zipfile.ZIP_STORED or not self._mapped(info):
+            raise ValueError(f"{info.filename} is compressed, use open() or read()")
+        return self._data(info)
+
+    def read(self, name, pwd=None) -> bytes:
+        info = name if isinstance(name, zipfile.ZipInfo) else self.getinfo(name)
+        if pwd is not None or not self._mapped(info):
+            return super().read(name, pwd)
+
+        with self._data(info) as data:
+            if info.compress_type == zipfile.ZIP_STORED:
+                out = bytes(data)
+            else:
+                out = zlib.decompress(data, -zlib.MAX_WBITS, max(info.file_size, 1))
+
+        if zlib.crc32(out) != info.CRC:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {info.filename!r}")
+        return out
+
+    def open(self, name, mode="r", pwd=None, *, force_zip64=False):
+        info = name if isinstance(name, zipfile.ZipInfo) else self.getinfo(name)
+        if mode != "r" or pwd is not None or not self._mapped(info):
+            return super().open(name, mode, pwd, force_zip64=force_zip64)
+        return io.BufferedReader(MappedMemberReader(self._data(info), info), MMAP_READ_SIZE)
+
+    def close(self) -> None:
+        super().close()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # a view or stream of a member is still in use, the map is closed when it is garbage collected
+                logger.debug("Could not close the memory map of %s, a member is still in use", self.filename)
+        self._file.close()
+
+
+def open_zipfile(zfile: str | os.PathLike) -> zipfile.ZipFile:
+    """
+    Opens a zipfile for reading, the zipfile is memory mapped if USE_MMAP (see MmapArchive)
+    """
+    if USE_MMAP and isinstance(zfile, (str, os.PathLike)):
+        return MmapArchive(zfile)
+    return zipfile.ZipFile(zfile, "r")
+
+
 def extract_file_from_zip(zfile: str, file_to_extract: str) -> io.BytesIO:
     """
     Extracts a specific file from a zipfile buffer
+    The file is matched on its full path in the zip or on its file name
     Function always returns a buffer
     """
     file_to_extract_bytes = io.BytesIO()
 
     try:
-        with zipfile.ZipFile(zfile, "r") as zf:
+        with open_zipfile(zfile) as zf:
             file_found = False
 
             for f in zf.namelist():
                 # skipping this log because for twitter (with huge nr of files)
                 # the console logs greatly slow down the browser
                 # logger.debug("Contained in zip: %s", f)
-                if Path(f).name == file_to_extract:
+                if f == file_to_extract or Path(f).name == file_to_extract:
                     #print('extract_file_from_zip found a message json', f)
 
                     file_to_extract_bytes = io.BytesIO(zf.read(f))
@@ -42,7 +207,11 @@ def extract_file_from_zip(zfile: str, file_to_extract: str) -> io.BytesIO:
             raise FileNotFoundInZipError("File not found in zip")
 
     except zipfile.BadZipFile as e:
-        logger.error("BadZipFile:  %s", e)
+        logger.error("BadZipFile:  %s, reading the local file headers", e)
+        try:
+            file_to_extract_bytes = io.BytesIO(ziprecover.read_member(zfile, file_to_extract))
+        except Exception as e:
+            logger.error("Could not recover %s: %s", file_to_extract, e)
     except FileNotFoundInZipError as e:
         logger.error("File not found:  %s: %s", file_to_extract, e)
     except Exception as e:
@@ -52,51 +221,241 @@ def extract_file_from_zip(zfile: str, file_to_extract: str) -> io.BytesIO:
         return file_to_extract_bytes
 
 
-def _json_reader_bytes(json_bytes: bytes, encoding: str) -> Any:
-    json_bytes_stream = io.BytesIO(json_bytes)
-    stream = io.TextIOWrapper(json_bytes_stream, encoding=encoding)
-    result = json.load(stream)
-    return result
+def namelist(zfile: str) -> list[str]:
+    """
+    Lists the files in a zipfile, the files of a truncated zipfile are found by their local file headers
+    """
+    try:
+        with open_zipfile(zfile) as zf:
+            return zf.namelist()
+    except zipfile.BadZipFile as e:
+        logger.warning("BadZipFile:  %s, reading the local file headers", e)
+        return ziprecover.namelist(zfile)
 
 
-def _json_reader_file(json_file: str, encoding: str) -> Any:
-    with open(json_file, 'r', encoding=encoding) as f:
-        result = json.load(f)
-    return result
+def get_file_size_from_zip(zfile: str, file_to_measure: str) -> int:
+    """
+    Returns the uncompressed size in bytes of a file in a zipfile
+    without extracting it, returns 0 if the file cannot be found
+    """
+    try:
+        with open_zipfile(zfile) as zf:
+            for info in zf.infolist():
+                if info.filename == file_to_measure or Path(info.filename).name == file_to_measure:
+                    return info.file_size
 
+    except zipfile.BadZipFile as e:
+        logger.error("BadZipFile:  %s, reading the local file headers", e)
+        try:
+            for member in ziprecover.scan_local_headers(zfile):
+                if member.filename == file_to_measure or Path(member.filename).name == file_to_measure:
+                    return member.file_size or 0
+        except Exception as e:
+            logger.error("Could not recover %s: %s", file_to_measure, e)
+    except Exception as e:
+        logger.error("Exception was caught:  %s", e)
 
-def _read_json(json_input: Any, json_reader: Callable[[Any, str], Any]) -> dict[Any, Any] | list[Any]:
+    return 0
+
+
+@contextmanager
+def open_file_from_zip(zfile: str, file_to_open: str) -> Iterator[io.BufferedIOBase]:
     """
-    Dunder function that read json_input and applies json_reader
-    Performs several checks (see code) and tries different encodings
+    Opens a specific file from a zipfile as a stream
+    The file is decompressed while it is read, it is never fully loaded in memory
+    The file is matched on its full path in the zip or on its file name
+
+    If the zipfile is truncated, the file is read up to the cut-off (see ziprecover)
+
+    Raises FileNotFoundInZipError if the file is not present
+    """
+    try:
+        zf = open_zipfile(zfile)
+    except zipfile.BadZipFile as e:
+        logger.warning("BadZipFile:  %s, reading the local file headers", e)
+        with ziprecover.open_member(zfile, file_to_open) as stream:
+            yield stream
+        return
+
+    with zf:
+        for f in zf.namelist():
+            if f == file_to_open or Path(f).name == file_to_open:
+                with zf.open(f, "r") as stream:
+                    yield stream
+                return
+
+    raise FileNotFoundInZipError("File not found in zip")
+
+
+# Byte order marks, UTF-32 is checked before UTF-16 because their little endian BOMs overlap
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+SNIFF_SIZE = 4096
+
+
+def sniff_encoding(head: bytes) -> str:
+    """
+    Detects the encoding from the first bytes of a file
+    BOMs are detected first, then UTF-16 without BOM, then UTF-8, and cp1252 or latin1 as last resort
+    """
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+
+    if len(head) >= 2 and head.count(0) > len(head) // 4:
+        # ASCII text encoded as UTF-16 has a null byte in every other position
+        return "utf-16-le" if head[1::2].count(0) > head[0::2].count(0) else "utf-16-be"
+
+    try:
+        # final=False: a multi byte character can be cut off at the end of head
+        codecs.getincrementaldecoder("utf8")().decode(head, final=False)
+        return "utf8"
+    except UnicodeDecodeError:
+        pass
+
+    try:
+        head.decode("cp1252")
+        return "cp1252"
+    except UnicodeDecodeError:
+        return "latin1"
+
+
+def _peek(stream: IO[bytes], size: int = SNIFF_SIZE) -> tuple[bytes, IO[bytes] | None]:
+    """
+    Returns the first bytes of stream without consuming them
+    Non-seekable streams are wrapped in a buffered reader, which is returned as well
+    """
+    if stream.seekable():
+        position = stream.tell()
+        head = stream.read(size)
+        stream.seek(position)
+        return head, None
+
+    buffered = io.BufferedReader(stream, buffer_size=max(size, io.DEFAULT_BUFFER_SIZE))  # type: ignore
+    return buffered.peek(size)[:size], buffered
+
+
+@contextmanager
+def decoded_stream(stream: IO[bytes]) -> Iterator[io.TextIOWrapper]:
+    """
+    Decodes a byte stream in a single pass
+    The encoding is sniffed from the first bytes, the bytes are decoded while the text is read.
+    The byte stream is not closed afterwards
+    """
+    head, buffered = _peek(stream)
+    encoding = sniff_encoding(head)
+    logger.debug("Detected encoding: %s", encoding)
+
+    text = io.TextIOWrapper(buffered or stream, encoding=encoding, newline="")  # type: ignore
+    try:
+        yield text
+    finally:
+        text.detach()
+        if buffered is not None:
+            buffered.detach()
+
+
+def _read_json(json_stream: IO[bytes]) -> dict[Any, Any] | list[Any]:
+    """
+    Dunder function that reads json from a byte stream
+    Performs several checks (see code), the encoding is detected with sniff_encoding
     """
 
     out: dict[Any, Any] | list[Any] = {}
 
-    encodings = ["utf8", "utf-8-sig"]
-    for encoding in encodings:
-        try:
-            result = json_reader(json_input, encoding)
+    try:
+        with decoded_stream(json_stream) as stream:
+            result = json.load(stream)
 
-            if not isinstance(result, (dict, list)):
-                raise TypeError("Did not convert bytes to a list or dict, but to another type instead")
+        if not isinstance(result, (dict, list)):
+            raise TypeError("Did not convert bytes to a list or dict, but to another type instead")
 
-            out = result
-            logger.debug("Succesfully converted json bytes with encoding: %s", encoding)
-            break
+        out = result
+        logger.debug("Succesfully converted json bytes")
 
-        except json.JSONDecodeError:
-            logger.error("Cannot decode json with encoding: %s", encoding)
-        except TypeError as e:
-            logger.error("%s, could not convert json bytes", e)
-            break
-        except Exception as e:
-            logger.error("%s, could not convert json bytes", e)
-            break
+    except json.JSONDecodeError as e:
+        logger.error("Cannot decode json: %s", e)
+    except TypeError as e:
+        logger.error("%s, could not convert json bytes", e)
+    except Exception as e:
+        logger.error("%s, could not convert json bytes", e)
 
     return out
 
 
+# a byte order mark that was not removed by the decoder is skipped as well
+JSON_WHITESPACE = " \t\r\n\ufeff"
+
+
+def iter_json_array(json_stream: IO[bytes], chunk_size: int = 1024 * 1024) -> Iterator[Any]:
+    """
+    Reads the items of a JSON array one at a time, the file is never fully loaded in memory
+    The encoding is detected with sniff_encoding
+
+    Raises json.JSONDecodeError if the file is not a JSON array or is malformed,
+    the items read before the error have been yielded
+    """
+    decoder = json.JSONDecoder()
+
+    with decoded_stream(json_stream) as stream:
+        buf = ""
+        pos = 0
+        eof = False
+
+        def read_more() -> None:
+            nonlocal buf, pos, eof
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+
+        def next_char() -> str:
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in JSON_WHITESPACE:
+                    pos += 1
+                if pos < len(buf):
+                    return buf[pos]
+                if eof:
+                    return ""
+                read_more()
+
+        if next_char() != "[":
+            raise json.JSONDecodeError("Expected a JSON array", buf, pos)
+        pos += 1
+        if next_char() == "]":
+            return
+
+        while True:
+            next_char()
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                    # an item that ends at the end of the buffer (a number) can continue in the next chunk
+                    if end < len(buf) or eof:
+                        break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                read_more()
+
+            pos = end
+            yield item
+
+            char = next_char()
+            if char == "]":
+                return
+            if char != ",":
+                raise json.JSONDecodeError("Expected ',' or ']'", buf, pos)
+            pos += 1
+
+
 def read_json_from_bytes(json_bytes: io.BytesIO) -> dict[Any, Any] | list[Any]:
     """
     Reads json from io.BytesIO buffer
@@ -107,8 +466,7 @@ def read_json_from_bytes(json_bytes: io.BytesIO) -> dict[Any, Any] | list[Any]:
 
     out: dict[Any, Any] | list[Any] = {}
     try:
-        b = json_bytes.read()
-        out = _read_json(b, _json_reader_bytes)
+        out = _read_json(json_bytes)
     except Exception as e:
         logger.error("%s, could not convert json bytes", e)
 
@@ -122,7 +480,13 @@ def read_json_from_file(json_file: str) -> dict[Any, Any] | list[Any]:
 
     Function returns {} in case of failure
     """
-    out = _read_json(json_file, _json_reader_file)
+    out: dict[Any, Any] | list[Any] = {}
+    try:
+        with open(json_file, "rb") as f:
+            out = _read_json(f)
+    except Exception as e:
+        logger.error("%s, could not read json file", e)
+
     return out
 
 
@@ -133,14 +497,12 @@ def read_csv_from_bytes(json_bytes: io.BytesIO) -> list[dict[Any, Any]]:
     """
     out: list[dict[Any, Any]] = []
 
-    b = json_bytes.read()
-
     try:
-        stream = io.TextIOWrapper(io.BytesIO(b), encoding="utf8")
-        reader = csv.DictReader(stream)
-        for row in reader:
-            out.append(row)
-        logger.debug("succesfully converted csv bytes with encoding utf8")
+        with decoded_stream(json_bytes) as stream:
+            reader = csv.DictReader(stream)
+            for row in reader:
+                out.append(row)
+        logger.debug("succesfully converted csv bytes")
 
     except Exception as e:
         logger.error("%s, could not convert csv bytes", e)
@@ -149,11 +511,79 @@ def read_csv_from_bytes(json_bytes: io.BytesIO) -> list[dict[Any, Any]]:
         return out
 
 
+def read_csv_columns(
+    csv_stream: IO[bytes], usecols: list[str] | None = None, dtypes: dict[str, Any] | None = None
+) -> pd.DataFrame:
+    """
+    Reads csv from a byte stream (for example a zip member stream) straight into column buffers
+
+    usecols: only these columns are kept (column projection), default all columns
+    dtypes: dtype hints per column, for example {"count": "Int64", "device": "category"}
+
+    In contrast to read_csv_from_bytes no dict is created per row.
+    Function returns an empty DataFrame in case of failure
+    """
+    out = pd.DataFrame()
+
+    try:
+        with decoded_stream(csv_stream) as stream:
+            reader = csv.reader(stream)
+            header = next(reader, [])
+
+            # in case of duplicate column names the last column wins, like csv.DictReader
+            positions = {name: i for i, name in enumerate(header) if usecols is None or name in usecols}
+            columns: dict[str, list[Any]] = {name: [] for name in positions}
+            appenders = [(i, columns[name].append) for name, i in positions.items()]
+            n_fields = len(header)
+
+            for row in reader:
+                if not row:
+                    continue
+                if len(row) == n_fields:
+                    for i, append in appenders:
+                        append(row[i])
+                else:
+                    for i, append in appenders:
+                        append(row[i] if i < len(row) else None)
+
+        out = pd.DataFrame(columns)
+        logger.debug("succesfully read %s csv columns", len(columns))
+
+        for column, dtype in (dtypes or {}).items():
+            if column in out:
+                try:
+                    out[column] = out[column].astype(dtype)
+                except (ValueError, TypeError) as e:
+                    logger.error("Could not convert csv column %s to %s: %s", column, dtype, e)
+
+    except Exception as e:
+        logger.error("%s, could not convert csv bytes", e)
+
+    return out
+
+
+def read_csv_from_zip(
+    zfile: str, file_to_read: str, usecols: list[str] | None = None, dtypes: dict[str, Any] | None = None
+) -> pd.DataFrame:
+    """
+    Reads csv from a zipfile without extracting the file into memory first
+    see read_csv_columns
+    """
+    out = pd.DataFrame()
+    try:
+        with open_file_from_zip(zfile, file_to_read) as stream:
+            out = read_csv_columns(stream, usecols, dtypes)
+    except zipfile.BadZipFile as e:
+        logger.error("BadZipFile:  %s", e)
+    except FileNotFoundInZipError as e:
+        logger.error("File not found:  %s: %s", file_to_read, e)
+
+    return out
+
+
 def read_csv_from_bytes_to_df(json_bytes: io.BytesIO) -> pd.DataFrame:
     """
     csv to pd.DataFrame
     expects io.BytesIO as input (from extract_file_from_zip)
     """
-    return pd.DataFrame(read_csv_from_bytes(json_bytes))
-
-
+    return read_csv_columns(json_bytes)
@@ -0,0 +1,299 @@
+"""
+Contains a reader for truncated or corrupt zipfiles
+
+zipfile.ZipFile needs the central directory at the end of the zipfile,
+which is missing when an upload is cut off. Every member is also preceded by a local file header,
+this reader walks these headers from the start of the file to rebuild a partial index of the members.
+Members are decompressed while they are read, a truncated member is read up to the cut-off.
+"""
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+import functools
+import io
+import logging
+import os
+import struct
+import zipfile
+import zlib
+
+from port.my_exceptions import FileNotFoundInZipError
+
+logger = logging.getLogger(__name__)
+
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+LOCAL_SIGNATURE = b"PK\x03\x04"
+CENTRAL_SIGNATURE = b"PK\x01\x02"
+
+FLAG_ENCRYPTED = 0x01
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+ZIP64_EXTRA = 0x0001
+
+READ_SIZE = 64 * 1024
+
+
+@dataclass
+class RecoveredMember:
+    """
+    Member found by its local file header
+
+    Attributes:
+        filename: path of the member in the zip
+        header_offset: offset of the local file header
+        data_offset: offset of the (compressed) data
+        compress_type: zipfile.ZIP_STORED or zipfile.ZIP_DEFLATED
+        compress_size: size of the compressed data, None if the header does not contain it (data descriptor)
+        file_size: size of the uncompressed data, None if the header does not contain it (data descriptor)
+        truncated: True if the file ends before the end of the compressed data
+    """
+    filename: str
+    header_offset: int
+    data_offset: int
+    compress_type: int
+    compress_size: int | None
+    file_size: int | None
+    truncated: bool = False
+
+
+def _zip64_sizes(extra: bytes, compress_size: int, file_size: int) -> tuple[int, int]:
+    pos = 0
+    while pos + 4 <= len(extra):
+        header_id, size = struct.unpack_from("<2H", extra, pos)
+        if header_id == ZIP64_EXTRA:
+            values = list(struct.unpack_from(f"<{size // 8}Q", extra, pos + 4))
+            if file_size == 0xFFFFFFFF and values:
+                file_size = values.pop(0)
+            if compress_size == 0xFFFFFFFF and values:
+                compress_size = values.pop(0)
+            break
+        pos += 4 + size
+    return compress_size, file_size
+
+
+def _plausible_header(f, offset: int) -> bool:
+    """
+    Checks if the bytes at offset look like a header, the signature alone can also occur in compressed data
+    """
+    f.seek(offset)
+    header = f.read(LOCAL_HEADER.size)
+    if header[:4] == CENTRAL_SIGNATURE:
+        return True
+    if len(header) < LOCAL_HEADER.size:
+        return False
+    _, version, _, compress_type, _, _, _, _, _, name_length, _ = LOCAL_HEADER.unpack(header)
+    return version < 100 and compress_type in (0, 8, 9, 12, 14) and 0 < name_length < 4096
+
+
+def _find_signature(f, start: int, end: int) -> int:
+    """
+    Returns the offset of the next local or central header at or after start, end if there is none
+    """
+    pos = start
+    while pos < end:
+        f.seek(pos)
+        chunk = f.read(READ_SIZE + 3)
+        if not chunk:
+            break
+
+        offset = 0
+        while True:
+            found = [i for i in (chunk.find(LOCAL_SIGNATURE, offset), chunk.find(CENTRAL_SIGNATURE, offset)) if i >= 0]
+            if not found:
+                break
+            offset = min(found)
+            if _plausible_header(f, pos + offset):
+                return pos + offset
+            offset += 1
+
+        pos += READ_SIZE
+    return end
+
+
+def scan_local_headers(zfile: str) -> list[RecoveredMember]:
+    """
+    Rebuilds the index of the members by walking the local file headers
+
+    Data of members with known sizes is skipped with a seek.
+    For members with a data descriptor the next header is searched for.
+    Scanning stops at the central directory, at the end of the file or at the first header that does not make sense.
+    The index is cached, the zipfile is scanned once no matter how many members are read.
+    """
+    stat = os.stat(zfile)
+    return list(_scan_local_headers(str(zfile), stat.st_size, stat.st_mtime_ns))
+
+
+@functools.lru_cache(maxsize=4)
+def _scan_local_headers(zfile: str, size: int, mtime: int) -> tuple[RecoveredMember, ...]:
+    members: list[RecoveredMember] = []
+
+    with open(zfile, "rb") as f:
+        end = f.seek(0, io.SEEK_END)
+        pos = 0
+
+        while pos + LOCAL_HEADER.size <= end:
+            f.seek(pos)
+            header = f.read(LOCAL_HEADER.size)
+            (signature, _, flags, compress_type, _, _, _,
+             compress_size, file_size, name_length, extra_length) = LOCAL_HEADER.unpack(header)
+
+            if signature != LOCAL_SIGNATURE:
+                if signature != CENTRAL_SIGNATURE:
+                    logger.info("No local file header at offset %s, stopped scanning", pos)
+                break
+
+            name = f.read(name_length)
+            extra = f.read(extra_length)
+            data_offset = pos + LOCAL_HEADER.size + name_length + extra_length
+            if data_offset > end:
+                break
+
+            filename = name.decode("utf8" if flags & FLAG_UTF8 else "cp437", errors="replace")
+            readable = not flags & FLAG_ENCRYPTED and compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+            if not readable:
+                logger.info("Skipped %s, encrypted or unsupported compression", filename)
+
+            if flags & FLAG_DATA_DESCRIPTOR:
+                next_header = _find_signature(f, data_offset, end)
+                # without a next header the member is cut off
+                truncated = next_header >= end
+                compress_size = None
+                if compress_type == zipfile.ZIP_STORED and not truncated:
+                    # stored data can only be delimited by the data descriptor (signature, crc, sizes)
+                    # in front of the next header
+                    compress_size = max(next_header - data_offset - 16, 0)
+                member = RecoveredMember(filename, pos, data_offset, compress_type, compress_size, None, truncated)
+                if readable:
+                    members.append(member)
+                pos = next_header
+                continue
+
+            compress_size, file_size = _zip64_sizes(extra, compress_size, file_size)
+            member = RecoveredMember(filename, pos, data_offset, compress_type, compress_size, file_size)
+            member.truncated = data_offset + compress_size > end
+            if readable:
+                members.append(member)
+            pos = data_offset + compress_size
+
+    n_truncated = sum(member.truncated for member in members)
+    logger.info("Recovered %s members from local file headers, %s truncated", len(members), n_truncated)
+    return tuple(members)
+
+
+class MemberReader(io.RawIOBase):
+    """
+    Reads a member found by its local file header, the member is decompressed while it is read
+
+    Reading stops at the end of the compressed data or at the end of the file,
+    after which truncated tells if the member was cut off.
+    """
+
+    def __init__(self, f, member: RecoveredMember) -> None:
+        self.f = f
+        self.member = member
+        self.position = member.data_offset
+        self.remaining = member.compress_size
+        self.inflater = zlib.decompressobj(-zlib.MAX_WBITS) if member.compress_type == zipfile.ZIP_DEFLATED else None
+        self.pending = b""
+        self.finished = False
+        self.truncated = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _read_compressed(self) -> bytes:
+        size = READ_SIZE if self.remaining is None else min(READ_SIZE, self.remaining)
+        if size <= 0:
+            return b""
+        self.f.seek(self.position)
+        data = self.f.read(size)
+        self.position += len(data)
+        if self.remaining is not None:
+            self.remaining -= len(data)
+        return data
+
+    def _fill(self, size: int) -> None:
+        while not self.pending and not self.finished:
+            if self.inflater is None:
+                self.pending = self._read_compressed()
+                if not self.pending:
+                    self.finished = True
+                    self.truncated = self.remaining is not None and self.remaining > 0
+                continue
+
+            data = self.inflater.unconsumed_tail or self._read_compressed()
+            if not data:
+                self.finished = True
+                self.truncated = not self.inflater.eof
+                self.pending = self.inflater.flush()
+                continue
+
+            try:
+                self.pending = self.inflater.decompress(data, size)
+            except zlib.error as e:
+                logger.error("Could not decompress %s: %s", self.member.filename, e)
+                self.finished = True
+                self.truncated = True
+                continue
+
+            if self.inflater.eof:
+                self.finished = True
+
+    def readinto(self, b) -> int:
+        self._fill(len(b))
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+
+def _match(members: list[RecoveredMember], name: str) -> RecoveredMember | None:
+    for member in members:
+        if member.filename == name or Path(member.filename).name == name:
+            return member
+    return None
+
+
+def namelist(zfile: str) -> list[str]:
+    return [member.filename for member in scan_local_headers(zfile)]
+
+
+@contextmanager
+def open_member(zfile: str, name: str) -> Iterator[io.BufferedReader]:
+    """
+    Opens a member of a truncated zipfile as a stream, the member is matched on its full path or its file name
+
+    Raises FileNotFoundInZipError if the member is not present
+    """
+    member = _match(scan_local_headers(zfile), name)
+    if member is None:
+        raise FileNotFoundInZipError("File not found in zip")
+
+    with open(zfile, "rb") as f:
+        reader = MemberReader(f, member)
+        stream = io.BufferedReader(reader, READ_SIZE)
+        try:
+            yield stream
+        finally:
+            if reader.truncated:
+                logger.warning("%s is truncated, it was read up to the cut-off", member.filename)
+
+
+def read_member(zfile: str, name: str) -> bytes:
+    """
+    Reads the intact part of a member of a truncated zipfile
+    """
+    with open_member(zfile, name) as stream:
+        return stream.read()
+
+
+def is_truncated(zfile: str) -> bool:
+    """
+    Checks if a zipfile can only be read by walking the local file headers
+    """
+    try:
+        with zipfile.ZipFile(zfile, "r"):
+            return False
+    except zipfile.BadZipFile:
+        return True
@@ -0,0 +1,39 @@
+import logging
+import zipfile
+
+import pytest
+
+import port.batch as batch
+import port.script as script
+
+
+@pytest.fixture
+def root_handlers():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+def test_configure_logging_logs_to_stderr_instead_of_the_donated_buffer(root_handlers, capsys):
+    logging.getLogger("port.test").warning("before")
+
+    batch.configure_logging()
+    logging.getLogger("port.test").warning("after")
+
+    assert script.LOG_STREAM.getvalue() == ""
+    assert "after" in capsys.readouterr().err
+
+
+def test_worker_errors_reach_stderr(tmp_path, capfd):
+    zips = tmp_path / "zips"
+    zips.mkdir()
+    with zipfile.ZipFile(zips / "no_activity.zip", "w") as z:
+        z.writestr("archive_browser.html", "<html></html>")
+        z.writestr("Takeout/Mijn activiteit/Assistent/MyActivity.html", "")
+
+    report = batch.process_directory(str(zips), str(tmp_path / "out"), workers=1)
+
+    assert report["status_code"].tolist() == [0]
+    assert "port.google_home --- ERROR" in capfd.readouterr().err
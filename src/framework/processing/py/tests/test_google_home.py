@@ -0,0 +1,126 @@
+import json
+import zipfile
+
+import port.google_home as google_home
+import port.memory as memory
+import port.sampling as sampling
+import port.unzipddp as unzipddp
+
+CARD = (
+    '<div class="outer-cell mdl-cell mdl-cell--12-col mdl-shadow--2dp"><div class="mdl-grid">'
+    '<div class="header-cell mdl-cell mdl-cell--12-col"><p class="mdl-typography--title">Assistant<br></p></div>'
+    '<div class="content-cell mdl-cell mdl-cell--6-col mdl-typography--body-1">'
+    'Gezegd&nbsp;<a href="https://www.google.com/search?q=x">{command}</a><br>Oké<br>{day} mrt 2024, 10:15:02 CET</div>'
+    '<div class="content-cell mdl-cell mdl-cell--6-col mdl-typography--body-1 mdl-typography--text-right"></div>'
+    '</div></div>'
+)
+
+
+def activity_html(n: int) -> str:
+    cards = "".join(CARD.format(command=f"zet lamp {i} aan", day=1 + i % 28) for i in range(n))
+    return f'<html><head><meta charset="utf-8"></head><body><div class="mdl-grid">{cards}</div></body></html>'
+
+
+def activity_json(n: int) -> str:
+    items = [
+        {
+            "header": "Assistant",
+            "title": f"Je hebt zet lamp {i} aan gezegd",
+            "time": f"2024-03-{1 + i % 28:02d}T10:15:02.000Z",
+            "subtitles": [{"name": "Oké"}],
+        }
+        for i in range(n)
+    ]
+    return json.dumps(items)
+
+
+def make_zip(path, files: dict[str, str]) -> str:
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, content in files.items():
+            z.writestr(name, content)
+    return str(path)
+
+
+def extract(zfile: str):
+    validation = google_home.validate(zfile)
+    return validation, google_home.google_home_to_df(zfile, validation)
+
+
+def test_activity_file_at_the_root_of_the_zip(tmp_path):
+    zfile = make_zip(tmp_path / "root.zip", {
+        "archive_browser.html": "<html></html>",
+        "MyActivity.html": activity_html(30),
+    })
+
+    validation, df = extract(zfile)
+
+    assert validation.status_code.id == 0
+    assert len(df) == 30
+
+
+def test_activity_files_of_other_products_are_skipped(tmp_path):
+    zfile = make_zip(tmp_path / "products.zip", {
+        "Takeout/archive_browser.html": "<html></html>",
+        "Takeout/Mijn activiteit/Assistent/MyActivity.html": activity_html(30),
+        "Takeout/Mijn activiteit/Zoeken/MyActivity.html": activity_html(50),
+    })
+
+    _, df = extract(zfile)
+
+    assert len(df) == 30
+
+
+def test_json_activity_file_at_the_root_of_the_zip(tmp_path):
+    zfile = make_zip(tmp_path / "root_json.zip", {
+        "archive_browser.html": "<html></html>",
+        "MyActivity.json": activity_json(20),
+    })
+
+    _, df = extract(zfile)
+
+    assert len(df) == 20
+
+
+def test_sampled_json_activity_is_streamed(tmp_path, monkeypatch):
+    zfile = make_zip(tmp_path / "sampled.zip", {
+        "archive_browser.html": "<html></html>",
+        "MyActivity.json": activity_json(200),
+    })
+
+    def read_whole_file(*args, **kwargs):
+        raise AssertionError("the activity file is loaded in memory")
+
+    monkeypatch.setattr(unzipddp, "read_json_from_bytes", read_whole_file)
+    validation = google_home.validate(zfile)
+    sampler = sampling.create_sampler(sampling.SamplingConfig(mode=sampling.SamplingMode.RESERVOIR, size=25))
+
+    df = google_home.google_home_to_df(zfile, validation, sampler=sampler)
+
+    assert len(df) == 25
+
+
+def test_streamed_html_is_not_sampled_because_of_its_file_size(tmp_path):
+    zfile = make_zip(tmp_path / "large.zip", {
+        "archive_browser.html": "<html></html>",
+        "MyActivity.html": activity_html(300),
+    })
+    # every file is estimated not to fit, the memory in use stays within the budget
+    budget = memory.MemoryBudget(expansion_factor=1e9, max_rows=50)
+
+    df = google_home.google_home_to_df(zfile, google_home.validate(zfile), budget)
+
+    assert len(df) == 300
+    assert not budget.degraded
+
+
+def test_streamed_html_is_sampled_when_the_memory_in_use_exceeds_the_budget(tmp_path):
+    zfile = make_zip(tmp_path / "large.zip", {
+        "archive_browser.html": "<html></html>",
+        "MyActivity.html": activity_html(300),
+    })
+    budget = memory.MemoryBudget(limit=-1, max_rows=50, check_every=10)
+
+    df = google_home.google_home_to_df(zfile, google_home.validate(zfile), budget)
+
+    assert len(df) < 50
+    assert budget.degraded
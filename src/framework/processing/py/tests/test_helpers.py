@@ -0,0 +1,75 @@
+import pandas as pd
+
+import port.helpers as helpers
+
+
+def test_split_dataframe_resets_the_index():
+    df = pd.DataFrame({"a": range(10)}, index=range(100, 110))
+
+    chunks = helpers.split_dataframe(df, 4)
+
+    assert [list(chunk.index) for chunk in chunks] == [[0, 1, 2, 3], [0, 1, 2, 3], [0, 1]]
+    assert [list(chunk["a"]) for chunk in chunks] == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_iter_dataframe_chunks_keeps_the_index_and_respects_max_bytes():
+    df = pd.DataFrame({"a": ["x" * 50] * 100}, index=range(100, 200))
+    row_bytes = helpers.estimate_row_bytes(df)
+
+    chunks = list(helpers.iter_dataframe_chunks(df, max_bytes=int(row_bytes * 30) + 1))
+
+    assert [len(chunk) for chunk in chunks] == [30, 30, 30, 10]
+    assert chunks[1].index[0] == 130
+
+
+NESTED = {
+    "title": "top",
+    "data": [
+        {"title": "first", "media": [{"uri": "a.jpg", "creation_timestamp": 1}]},
+        {"sub_title": "second", "media": [{"uri": "b.jpg", "title": "deep"}]},
+    ],
+    "string_map_data": {"Time (UTC)": {"timestamp": 5}, "a.b": {"value": "dot"}},
+}
+
+
+def test_denested_index_matches_find_items_on_a_dict():
+    denested = helpers.dict_denester(NESTED)
+    index = helpers.DenestedIndex(denested)
+
+    queries = ["title", "titl", "uri", "media-0-uri", "timestamp", "Time (UTC)", "a.b", "a*b", "(", "", "missing"]
+    for query in queries:
+        assert helpers.find_items(index, query) == helpers.find_items(denested, query), query
+
+
+def test_find_items_matches_regex_characters_literally():
+    denested = helpers.dict_denester(NESTED)
+
+    assert helpers.find_items(denested, "a.b") == "dot"
+    assert helpers.find_items(denested, "a*b") == ""
+    assert helpers.find_items(denested, "Time (UTC)") == "5"
+
+
+def test_denested_index_find_suffix_matches_whole_key_parts():
+    index = helpers.DenestedIndex.from_nested(NESTED)
+
+    assert index.find_suffix("uri") == "a.jpg"
+    assert index.find_suffix("1-media-0-uri") == "b.jpg"
+    assert index.find_suffix("titl") == ""
+
+
+def test_sort_isotimestamp_empty_timestamp_last():
+    timestamps = pd.Series([
+        "2024-01-01T10:00:00Z", "", None, "2024-03-01, 10:00:00", "not a date", "2024-02-01T10:00:00+01:00",
+    ])
+
+    order = timestamps.sort_values(key=helpers.sort_isotimestamp_empty_timestamp_last, kind="stable").index.tolist()
+
+    assert order[:3] == [3, 5, 0]
+
+
+def test_sort_isotimestamp_treats_values_that_are_not_strings_as_empty():
+    timestamps = pd.Series(["2024-01-01T10:00:00Z", 5, ["2024-06-01T10:00:00Z"], b"2024-06-01T10:00:00Z"], dtype=object)
+
+    datetimes = helpers.parse_sortable_timestamps(timestamps)
+
+    assert datetimes.notna().tolist() == [True, False, False, False]
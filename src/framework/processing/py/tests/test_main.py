@@ -0,0 +1,46 @@
+import json
+
+from port.api.commands import CommandSystemDonate
+from port.main import ScriptWrapper
+
+
+class Unserializable:
+    def toDict(self):
+        raise ValueError("cannot serialize")
+
+
+def donations_then_error():
+    yield CommandSystemDonate("logs", "log 1")
+    yield CommandSystemDonate("status", "log 2")
+    raise RuntimeError("extraction failed")
+
+
+def test_donations_are_sent_when_the_script_raises():
+    wrapper = ScriptWrapper(donations_then_error())
+
+    batch = json.loads(wrapper.send(None))
+
+    assert batch["__type__"] == "CommandBatch"
+    donations, exit = batch["commands"][:2], batch["commands"][2]
+    assert [d["key"] for d in donations] == ["logs", "status"]
+    assert exit["__type__"] == "CommandSystemExit"
+    assert exit["code"] == 1
+
+
+def test_donations_are_sent_when_the_script_raises_without_json_bytes():
+    wrapper = ScriptWrapper(donations_then_error(), json_bytes=False)
+
+    batch = wrapper.send(None)
+
+    types = [c["__type__"] for c in batch["commands"]]
+    assert types == ["CommandSystemDonate", "CommandSystemDonate", "CommandSystemExit"]
+
+
+def test_a_command_that_cannot_be_serialized_does_not_discard_the_batch():
+    def script():
+        yield CommandSystemDonate("logs", "log 1")
+        yield Unserializable()
+
+    batch = json.loads(ScriptWrapper(script()).send(None))
+
+    assert [c["__type__"] for c in batch["commands"]] == ["CommandSystemDonate", "CommandSystemExit"]
@@ -32,10 +32,7 @@ function runCycle(payload) {
     scriptEvent = pyScript.send(payload)
     self.postMessage({
       eventType: 'runCycleDone',
-      scriptEvent: scriptEvent.toJs({
-        create_proxies: false,
-        dict_converter: Object.fromEntries
-      })
+      scriptEvent: toCommand(scriptEvent)
     })
   } catch (error) {
     self.postMessage({
@@ -45,6 +42,26 @@ function runCycle(payload) {
   }
 }
 
+const utf8Decoder = new TextDecoder()
+
+function toCommand(scriptEvent) {
+  // Commands serialized by Python to a JSON buffer are parsed in one go,
+  // dicts are converted object by object
+  if (scriptEvent.type === 'bytes') {
+    const buffer = scriptEvent.getBuffer('u8')
+    try {
+      return JSON.parse(utf8Decoder.decode(buffer.data))
+    } finally {
+      buffer.release()
+      scriptEvent.destroy()
+    }
+  }
+  return scriptEvent.toJs({
+    create_proxies: false,
+    dict_converter: Object.fromEntries
+  })
+}
+
 function unwrap(response) {
   console.log('[ProcessingWorker] unwrap response: ' + JSON.stringify(response.payload))
   return new Promise((resolve) => {
@@ -75,10 +75,19 @@ export function isPayloadJSON (arg: any): arg is PayloadJSON {
 
 export type Command =
   CommandUI |
-  CommandSystem
+  CommandSystem |
+  CommandBatch
 
 export function isCommand (arg: any): arg is Command {
-  return isCommandUI(arg) || isCommandSystem(arg)
+  return isCommandUI(arg) || isCommandSystem(arg) || isCommandBatch(arg)
+}
+
+export interface CommandBatch {
+  __type__: 'CommandBatch'
+  commands: Command[]
+}
+export function isCommandBatch (arg: any): arg is CommandBatch {
+  return isInstanceOf<CommandBatch>(arg, 'CommandBatch', ['commands']) && Array.isArray(arg.commands) && arg.commands.every(isCommand)
 }
 
 export type CommandSystem =
@@ -51,6 +51,24 @@ export const ConsentForm = (props: Props): JSX.Element => {
     return text
   }
 
+  // Columns with repeated values are sent dictionary encoded: {"dictionary": [values], "codes": [codes]}
+  function decodeDataFrame(dataFrame: any): any {
+    const result: any = {}
+    for (const column of columnNames(dataFrame)) {
+      const data = dataFrame[column]
+      if (data?.dictionary !== undefined && data?.codes !== undefined) {
+        const decoded: any = {}
+        data.codes.forEach((code: number, row: number) => {
+          decoded[`${row}`] = code < 0 ? null : data.dictionary[code]
+        })
+        result[column] = decoded
+      } else {
+        result[column] = data
+      }
+    }
+    return result
+  }
+
   function columnNames(dataFrame: any): string[] {
     return Object.keys(dataFrame)
   }
@@ -89,7 +107,9 @@ export const ConsentForm = (props: Props): JSX.Element => {
     const description =
       tableData.description !== undefined ? Translator.translate(tableData.description, props.locale) : ""
     const deletedRowCount = 0
-    const dataFrame = JSON.parse(tableData.data_frame)
+    // The table is a JSON string when the command was converted with toJs, it is already parsed when the command was sent as JSON
+    const data = typeof tableData.data_frame === 'string' ? JSON.parse(tableData.data_frame) : tableData.data_frame
+    const dataFrame = decodeDataFrame(data)
     const headCells = columnNames(dataFrame).map((column: string) => column)
     const head: PropsUITableHead = {
       __type__: "PropsUITableHead",